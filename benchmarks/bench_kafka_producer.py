@@ -0,0 +1,142 @@
+"""
+Benchmark of the kafka producer settings (compression, batch size, linger).
+
+For each setting it reports the bytes of the record batches, as these are sent on the wire,
+and, if a broker is given (e.g. a local single-node kafka in docker), the throughput of
+publishing synthetic per metric messages in it.
+
+Usage:
+    python3 benchmarks/bench_kafka_producer.py [--bootstrap-servers localhost:9092]
+        [--topic bench.kubernetes] [--messages N]
+"""
+
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from kafka import KafkaProducer  # noqa: E402
+from kafka.record.memory_records import MemoryRecordsBuilder  # noqa: E402
+from kafka_client.serializers import JsonSerializer, MetricPayloadEncoder  # noqa: E402
+from settings import PROMETHEUS_METRICS_LIST, KAFKA_API_VERSION  # noqa: E402
+
+COMPRESSION_TYPES = {"none": 0, "gzip": 1, "snappy": 2, "lz4": 3}
+BATCH_SIZES = (16384, 131072)
+LINGER_MS = (0, 50)
+
+
+def generate_messages(count):
+    """ Generate per metric messages of distinct containers
+
+    Args:
+        count (int): The number of messages
+
+    Returns:
+        list: the encoded messages
+    """
+    encoder = MetricPayloadEncoder(PROMETHEUS_METRICS_LIST)
+    metrics = itertools.cycle(PROMETHEUS_METRICS_LIST)
+    return [encoder.encode("{:032x}".format(i // len(PROMETHEUS_METRICS_LIST)), metric['name'],
+                           [("2019-02-13T10:14:32.897000Z", str(i * 0.37))])
+            for i, metric in zip(range(count), metrics)]
+
+
+def measure_wire_bytes(messages, compression_type, batch_size):
+    """ Build the record batches (magic v2) of the messages and sum their size
+
+    Args:
+        messages (list): The encoded messages
+        compression_type (str): The compression type
+        batch_size (int): The max size of a batch
+
+    Returns:
+        int: the bytes of the record batches or None if the compression is not available
+    """
+    total, builder = 0, None
+    try:
+        for message in messages:
+            if builder is None:
+                builder = MemoryRecordsBuilder(2, COMPRESSION_TYPES[compression_type], batch_size)
+            if builder.append(0, None, message, []) is None:
+                builder.close()
+                total += builder.size_in_bytes()
+                builder = MemoryRecordsBuilder(2, COMPRESSION_TYPES[compression_type], batch_size)
+                builder.append(0, None, message, [])
+        if builder is not None:
+            builder.close()
+            total += builder.size_in_bytes()
+    except Exception:
+        return None
+    return total
+
+
+def measure_throughput(messages, bootstrap_servers, topic, compression_type, batch_size,
+                       linger_ms):
+    """ Publish the messages in the broker and measure the throughput
+
+    Args:
+        messages (list): The encoded messages
+        bootstrap_servers (str): The kafka broker
+        topic (str): The topic
+        compression_type (str): The compression type
+        batch_size (int): The max size of a batch
+        linger_ms (int): The linger of the batches
+
+    Returns:
+        float: the messages per second or None if the compression is not available
+    """
+    try:
+        producer = KafkaProducer(bootstrap_servers=bootstrap_servers, api_version=KAFKA_API_VERSION,
+                                 value_serializer=JsonSerializer(),
+                                 compression_type=None if compression_type == "none" else
+                                 compression_type,
+                                 batch_size=batch_size, linger_ms=linger_ms)
+    except (AssertionError, ValueError):
+        return None
+    # Warm-up: fetch the metadata of the topic
+    producer.send(topic, messages[0]).get(timeout=30)
+    started_at = time.perf_counter()
+    for message in messages:
+        producer.send(topic, message)
+    producer.flush()
+    elapsed = time.perf_counter() - started_at
+    producer.close()
+    return len(messages) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bootstrap-servers", default=None,
+                        help="the kafka broker; if it is missing, only the bytes are reported")
+    parser.add_argument("--topic", default="bench.kubernetes")
+    parser.add_argument("--messages", type=int, default=50000)
+    args = parser.parse_args()
+
+    messages = generate_messages(args.messages)
+    raw_bytes = sum(len(message) for message in messages)
+    print("{} messages, {} bytes of JSON".format(len(messages), raw_bytes))
+    print("{:<8} {:>10} {:>8} {:>14} {:>10} {:>12}".format(
+        "codec", "batch", "linger", "wire bytes", "ratio", "msg/s"))
+
+    # The linger affects only the throughput against a broker
+    linger_values = LINGER_MS if args.bootstrap_servers else (0,)
+    for compression_type, batch_size, linger_ms in itertools.product(
+            COMPRESSION_TYPES, BATCH_SIZES, linger_values):
+        wire_bytes = measure_wire_bytes(messages, compression_type, batch_size)
+        if wire_bytes is None:
+            print("{:<8} not available".format(compression_type))
+            continue
+        throughput = None
+        if args.bootstrap_servers:
+            throughput = measure_throughput(messages, args.bootstrap_servers, args.topic,
+                                            compression_type, batch_size, linger_ms)
+        print("{:<8} {:>10} {:>8} {:>14} {:>10.3f} {:>12}".format(
+            compression_type, batch_size, linger_ms, wire_bytes, wire_bytes / raw_bytes,
+            "-" if throughput is None else "{:.0f}".format(throughput)))
+
+
+if __name__ == '__main__':
+    main()
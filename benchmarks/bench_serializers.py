@@ -0,0 +1,56 @@
+"""
+Micro-benchmark of the serialization of the per metric kafka messages.
+
+Usage:
+    python3 benchmarks/bench_serializers.py [--messages N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from kafka_client.serializers import JsonSerializer, MetricPayloadEncoder  # noqa: E402
+
+METRIC = {"name": "container_cpu_system_seconds_total", "type": "counter", "unit": "seconds"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100000,
+                        help="number of serialized messages per run")
+    args = parser.parse_args()
+
+    containers = ["{:032x}".format(i) for i in range(args.messages)]
+    timestamp, value = "2019-02-13T10:14:32.897000Z", "0.21000000000000016"
+
+    def payload(container_id):
+        return {"container_id": container_id, "type": METRIC['type'],
+                "data": [{"timestamp": timestamp, "unit": METRIC['unit'], "type": METRIC['type'],
+                          "name": METRIC['name'], "value": value}]}
+
+    runs = [("json.dumps (baseline)",
+             lambda: [json.dumps(payload(c)).encode('utf-8') for c in containers])]
+    for backend in ("json", "ujson", "orjson"):
+        try:
+            serializer = JsonSerializer(backend)
+            encoder = MetricPayloadEncoder([METRIC], backend)
+        except ValueError:
+            print("{:<30} not installed".format(backend))
+            continue
+        runs.append(("{} serializer".format(backend),
+                     lambda s=serializer: [s(payload(c)) for c in containers]))
+        runs.append(("{} pre-encoded".format(backend),
+                     lambda e=encoder: [e.encode(c, METRIC['name'], [(timestamp, value)])
+                                        for c in containers]))
+
+    for name, run in runs:
+        best = min(timeit.repeat(run, number=1, repeat=5))
+        print("{:<30} {:>8.3f} us/message".format(name, best * 1e6 / args.messages))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""
+Micro-benchmark of the timestamp formatting per published sample.
+
+Usage:
+    python3 benchmarks/bench_timestamps.py [--samples N] [--timestamps N]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from utils import convert_unix_timestamp_to_datetime_str  # noqa: E402
+
+
+def strftime_formatter(unix_ts):
+    """The formatter that was used before the cache (baseline)"""
+    return datetime.utcfromtimestamp(unix_ts).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--samples", type=int, default=100000,
+                        help="number of formatted samples per run")
+    parser.add_argument("--timestamps", type=int, default=4,
+                        help="number of distinct (step-aligned) timestamps among the samples")
+    args = parser.parse_args()
+
+    # Within a cycle, almost all the samples share a few step-aligned timestamps
+    timestamps = [1545288169.897 + 20 * (i % args.timestamps) for i in range(args.samples)]
+    uncached_formatter = convert_unix_timestamp_to_datetime_str.__wrapped__
+
+    formatters = (("strftime (baseline)", strftime_formatter),
+                  ("manual formatter", uncached_formatter),
+                  ("manual formatter + LRU cache", convert_unix_timestamp_to_datetime_str))
+    for name, formatter in formatters:
+        convert_unix_timestamp_to_datetime_str.cache_clear()
+        best = min(timeit.repeat(lambda: [formatter(ts) for ts in timestamps],
+                                 number=1, repeat=5))
+        print("{:<30} {:>8.3f} us/sample".format(name, best * 1e6 / args.samples))
+
+
+if __name__ == '__main__':
+    main()
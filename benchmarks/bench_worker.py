@@ -0,0 +1,287 @@
+"""
+End-to-end benchmark of a collection cycle (`worker.main`) against local stand-ins.
+
+A stub of the Prometheus API, running in a child process, serves synthetic `query` and
+`query_range` responses generated from `samples/query_range_response.json` and scaled to N
+pods x M steps; the messages are captured by an in-process fake producer. For each cycle it
+reports the wall time, the CPU time, the Prometheus requests and the kafka messages, along
+with the peak RSS of the process.
+
+The settings of the publisher are given as environment variables (or through `--env`), e.g.
+`--env PROMETHEUS_QUERY_BATCH_SIZE=8 --env PROMETHEUS_STREAM_RESPONSES=1`.
+
+Usage:
+    python3 benchmarks/bench_worker.py [--pods N] [--steps M] [--cycles C]
+        [--env KEY=VALUE ...]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import resource
+import statistics
+import sys
+import time
+import urllib.parse
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+SAMPLE_FILE = os.path.join(BASE_DIR, "samples", "query_range_response.json")
+METRIC_NAME_PATTERN = re.compile(r'"metric_name",\s*"([^"]+)"')
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def parse_time(value):
+    """ Parse a time parameter of the Prometheus API (unix or the publisher's format)
+
+    Args:
+        value (str): The time
+
+    Returns:
+        float: the unix timestamp
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return (datetime.strptime(value, TIME_FORMAT) - datetime(1970, 1, 1)).total_seconds()
+
+
+def parse_step(value):
+    """ Parse a step parameter of the Prometheus API, e.g. `20s` or `1m`
+
+    Args:
+        value (str): The step
+
+    Returns:
+        float: the step in seconds
+    """
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+class StubPrometheusServer(ThreadingMixIn, HTTPServer):
+    """StubPrometheusServer Class.
+
+    It answers the queries of the publisher with N synthetic pods. The metric(s) of a query
+    are resolved from its `metric_name` labels (batched queries) or from the pre-built
+    queries of the metric registry.
+
+    Attributes:
+        pods (int): The number of the pods
+        steps (int): The number of the values per series in the `query_range` responses
+        queries (dict): The metric name per (decoded) PromQL query
+        requests (object): The shared counter of the served requests
+    """
+    daemon_threads = True
+
+    def __init__(self, pods, steps):
+        """Class Constructor."""
+        super(StubPrometheusServer, self).__init__(("127.0.0.1", 0), StubPrometheusHandler)
+        self.pods = pods
+        self.steps = steps
+        self.queries = {}
+        self.pod_labels_query = None
+        self.requests = multiprocessing.get_context("fork").Value("i", 0)
+        with open(SAMPLE_FILE) as sample:
+            series = json.load(sample)['data']['result'][0]
+        self.sample_values = [value for _, value in series['values']]
+        self.pod_labels = [{"label_ow_action": series['metric']['label_ow_action'],
+                            "label_vim_id": "{:032x}".format(index),
+                            "pod": "bench-pod-{:05d}".format(index)} for index in range(pods)]
+
+    def build_response(self, promql, end, step, instant):
+        """ Build the response of a query
+
+        Args:
+            promql (str): The decoded PromQL query
+            end (float): The evaluation (or the end) unix timestamp
+            step (float): The step of a `query_range`
+            instant (bool): True for a `query` (vector) response
+
+        Returns:
+            bytes: the JSON body
+        """
+        if promql == self.pod_labels_query:
+            metric_names = [None]
+        else:
+            metric_names = METRIC_NAME_PATTERN.findall(promql) or [self.queries.get(promql)]
+        joined = "kube_pod_labels" in promql
+        steps = 1 if instant else self.steps
+        timestamps = [end - (steps - 1 - index) * step for index in range(steps)]
+
+        results = []
+        for offset, metric_name in enumerate(metric_names):
+            for index, pod_labels in enumerate(self.pod_labels):
+                if metric_name is None or joined:
+                    labels = dict(pod_labels)
+                else:
+                    labels = {"pod_name": pod_labels['pod']}
+                if metric_name is not None and len(metric_names) > 1:
+                    labels['metric_name'] = metric_name
+                values = [[timestamp, "1" if metric_name is None else
+                           self.sample_values[(index + offset + i) % len(self.sample_values)]]
+                          for i, timestamp in enumerate(timestamps)]
+                result = {"metric": labels}
+                if instant:
+                    result['value'] = values[-1]
+                else:
+                    result['values'] = values
+                results.append(result)
+        return json.dumps({"status": "success",
+                           "data": {"resultType": "vector" if instant else "matrix",
+                                    "result": results}}).encode('utf-8')
+
+
+class StubPrometheusHandler(BaseHTTPRequestHandler):
+    """ Serve the `/api/v1/query` and the `/api/v1/query_range` of the stub """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        with self.server.requests.get_lock():
+            self.server.requests.value += 1
+        if url.path == "/api/v1/query":
+            body = self.server.build_response(params['query'], parse_time(params['time']), 0,
+                                              instant=True)
+        elif url.path == "/api/v1/query_range":
+            body = self.server.build_response(params['query'], parse_time(params['end']),
+                                              parse_step(params['step']), instant=False)
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeProducer(object):
+    """FakeProducer Class.
+
+    It serializes and counts the published messages instead of sending them to kafka.
+
+    Attributes:
+        spool (object): Always None
+        messages (int): The published messages since the creation
+        bytes (int): The serialized bytes since the creation
+    """
+
+    def __init__(self, serializer):
+        """Class Constructor."""
+        self.spool = None
+        self.messages = 0
+        self.bytes = 0
+        self.__serializer = serializer
+        self.__pending = 0
+
+    def connect(self):
+        return True
+
+    def publish(self, payload, key=None):
+        self.bytes += len(self.__serializer(payload))
+        self.messages += 1
+        self.__pending += 1
+
+    def replay(self, max_messages):
+        return 0
+
+    def flush(self, timeout=None):
+        counters = Counter(acked=self.__pending)
+        self.__pending = 0
+        return counters
+
+    def close(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pods", type=int, default=200, help="number of the synthetic pods")
+    parser.add_argument("--steps", type=int, default=10,
+                        help="number of the values per series in the query_range responses")
+    parser.add_argument("--cycles", type=int, default=5)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="a setting of the publisher (see README)")
+    args = parser.parse_args()
+
+    # The stub is bound before the settings are loaded, so they point at its port
+    server = StubPrometheusServer(args.pods, args.steps)
+    os.environ.update({"PROMETHEUS_HOST": "127.0.0.1",
+                       "PROMETHEUS_PORT": str(server.server_address[1]),
+                       "PROMETHEUS_HTTP_MAX_RETRIES": "0", "METRICS_PORT": "0"})
+    os.environ.update(item.split("=", 1) for item in args.env)
+
+    import worker
+    from kafka_client.serializers import JsonSerializer
+    from pod_labels import PodLabelsIndex, POD_LABELS_QUERY
+    from prometheus_client.v1 import query, query_range
+    from registry import metric_registry
+    from settings import SCHEDULER_SECONDS, KAFKA_JSON_BACKEND
+    from watermarks import WatermarkStore
+
+    for metric in metric_registry.collected_metrics():
+        for join in (True, False):
+            server.queries[urllib.parse.unquote(
+                metric_registry.get_query(metric['name'], join=join))] = metric['name']
+    server.pod_labels_query = POD_LABELS_QUERY
+    stub = multiprocessing.get_context("fork").Process(target=server.serve_forever,
+                                                       daemon=True)
+    stub.start()
+
+    producer = FakeProducer(JsonSerializer(KAFKA_JSON_BACKEND))
+    if worker.PROMETHEUS_QUERY_MODE == "instant":
+        prom_ql = query.Query(stream=worker.PROMETHEUS_STREAM_RESPONSES)
+    else:
+        prom_ql = query_range.QueryRange(stream=worker.PROMETHEUS_STREAM_RESPONSES)
+    pod_labels = PodLabelsIndex(worker.PROMETHEUS_POD_LABELS_TTL) \
+        if worker.PROMETHEUS_POD_LABELS_TTL > 0 else None
+    watermarks = WatermarkStore(None, worker.WATERMARKS_MAX_BACKFILL_SECONDS) \
+        if worker.WATERMARKS_ENABLED else None
+
+    print("{} pods x {} steps, {} metrics".format(args.pods, args.steps,
+                                                  len(worker.SHARD_METRICS_LIST)))
+    print("{:>5} {:>10} {:>10} {:>10} {:>10} {:>12}".format(
+        "cycle", "wall (s)", "cpu (s)", "requests", "messages", "bytes"))
+    interval = int(SCHEDULER_SECONDS)
+    window_end = time.time() - args.cycles * interval
+    wall_times, cpu_times = [], []
+    try:
+        for cycle in range(args.cycles):
+            window_end += interval
+            requests_before = server.requests.value
+            messages_before, bytes_before = producer.messages, producer.bytes
+            wall_started, cpu_started = time.perf_counter(), time.process_time()
+            worker.main(producer, prom_ql, pod_labels, window=(window_end - interval, window_end),
+                        watermarks=watermarks)
+            wall_times.append(time.perf_counter() - wall_started)
+            cpu_times.append(time.process_time() - cpu_started)
+            print("{:>5} {:>10.3f} {:>10.3f} {:>10} {:>10} {:>12}".format(
+                cycle, wall_times[-1], cpu_times[-1], server.requests.value - requests_before,
+                producer.messages - messages_before, producer.bytes - bytes_before))
+    finally:
+        stub.terminate()
+        stub.join()
+
+    # The `ru_maxrss` is in KB on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+    print("median wall {:.3f} s, median cpu {:.3f} s, peak RSS {:.1f} MB".format(
+        statistics.median(wall_times), statistics.median(cpu_times), peak_rss_mb))
+
+
+if __name__ == '__main__':
+    main()
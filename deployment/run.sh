@@ -9,6 +9,49 @@ sed -i "s/ENV_PROMETHEUS_HOST/$PROMETHEUS_HOST/g" /etc/supervisor/supervisord.co
 sed -i "s/ENV_PROMETHEUS_PORT/$PROMETHEUS_PORT/g" /etc/supervisor/supervisord.conf
 sed -i "s/ENV_PROMETHEUS_POLLING_STEP/$PROMETHEUS_POLLING_STEP/g" /etc/supervisor/supervisord.conf
 sed -i "s/ENV_SCHEDULER_SECONDS/$SCHEDULER_SECONDS/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_QUERY_MODE/${PROMETHEUS_QUERY_MODE:-range}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_STREAM_RESPONSES/${PROMETHEUS_STREAM_RESPONSES:-0}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_MAX_CONCURRENT_QUERIES/${PROMETHEUS_MAX_CONCURRENT_QUERIES:-8}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_QUERY_BATCH_SIZE/${PROMETHEUS_QUERY_BATCH_SIZE:-1}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_POD_LABELS_TTL/${PROMETHEUS_POD_LABELS_TTL:-0}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_HTTP_POOL_SIZE/${PROMETHEUS_HTTP_POOL_SIZE:-${PROMETHEUS_MAX_CONCURRENT_QUERIES:-8}}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_HTTP_MAX_RETRIES/${PROMETHEUS_HTTP_MAX_RETRIES:-2}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_HTTP_BACKOFF_FACTOR/${PROMETHEUS_HTTP_BACKOFF_FACTOR:-0.5}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_PROMETHEUS_HTTP_TIMEOUT/${PROMETHEUS_HTTP_TIMEOUT:-15}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_DERIVED_METRICS_MODE/${DERIVED_METRICS_MODE:-promql}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_DERIVED_METRICS_EXTRA/${DERIVED_METRICS_EXTRA:-}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_SHARD_COUNT/${SHARD_COUNT:-1}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_SHARD_INDEX/${SHARD_INDEX:-0}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_SHARD_STRATEGY/${SHARD_STRATEGY:-metric}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_METRICS_PORT/${METRICS_PORT:-9108}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_COMPRESSION_TYPE/${KAFKA_COMPRESSION_TYPE:-none}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_BATCH_SIZE/${KAFKA_BATCH_SIZE:-16384}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_LINGER_MS/${KAFKA_LINGER_MS:-0}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_BUFFER_MEMORY/${KAFKA_BUFFER_MEMORY:-33554432}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_ACKS/${KAFKA_ACKS:-1}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_MAX_BLOCK_MS/${KAFKA_MAX_BLOCK_MS:-5000}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_KEY_STRATEGY/${KAFKA_KEY_STRATEGY:-container_id}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_PARTITIONER/${KAFKA_PARTITIONER:-default}/g" /etc/supervisor/supervisord.conf
+sed -i "s|ENV_KAFKA_SPOOL_DIR|${KAFKA_SPOOL_DIR:-}|g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_SPOOL_SEGMENT_BYTES/${KAFKA_SPOOL_SEGMENT_BYTES:-8388608}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_SPOOL_MAX_BYTES/${KAFKA_SPOOL_MAX_BYTES:-536870912}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_SPOOL_REPLAY_MAX_MESSAGES/${KAFKA_SPOOL_REPLAY_MAX_MESSAGES:-5000}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_PAYLOAD_MODE/${KAFKA_PAYLOAD_MODE:-metric}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_JSON_BACKEND/${KAFKA_JSON_BACKEND:-auto}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_KAFKA_FLUSH_TIMEOUT/${KAFKA_FLUSH_TIMEOUT:-30}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_WATERMARKS_ENABLED/${WATERMARKS_ENABLED:-0}/g" /etc/supervisor/supervisord.conf
+sed -i "s|ENV_WATERMARKS_FILE|${WATERMARKS_FILE:-}|g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_WATERMARKS_MAX_BACKFILL_SECONDS/${WATERMARKS_MAX_BACKFILL_SECONDS:-3600}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_INGESTION_MODE/${INGESTION_MODE:-poll}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_REMOTE_WRITE_PORT/${REMOTE_WRITE_PORT:-9201}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_REMOTE_WRITE_STALENESS_SECONDS/${REMOTE_WRITE_STALENESS_SECONDS:-300}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_STATE_BACKEND/${STATE_BACKEND:-memory}/g" /etc/supervisor/supervisord.conf
+sed -i "s|ENV_STATE_REDIS_URL|${STATE_REDIS_URL:-redis://localhost:6379/0}|g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_STATE_KEY_PREFIX/${STATE_KEY_PREFIX:-k8s-prometheus-publisher}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_STATE_LEADER_LOCK/${STATE_LEADER_LOCK:-0}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_SUPPRESSION_ENABLED/${SUPPRESSION_ENABLED:-0}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_SUPPRESSION_THRESHOLD/${SUPPRESSION_THRESHOLD:-0.0}/g" /etc/supervisor/supervisord.conf
+sed -i "s/ENV_SUPPRESSION_HEARTBEAT_CYCLES/${SUPPRESSION_HEARTBEAT_CYCLES:-10}/g" /etc/supervisor/supervisord.conf
 
 # Restart services
 service supervisor start && service supervisor status
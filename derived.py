@@ -0,0 +1,128 @@
+"""
+A module that computes the derived metrics (e.g. packet loss) of all the containers at once.
+"""
+
+import logging.config
+from settings import LOGGING
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+
+
+class DerivedMetricsStage(object):
+    """DerivedMetricsStage Class.
+
+    The values of the input metrics are collected per container into columns, i.e. a list
+    per metric indexed by the container, and each derived metric is computed as
+    `scale * numerator / denominator` for all the containers in one pass (vectorized if
+    NumPy is installed). A derived metric is 0 if its denominator is 0 and it is skipped for
+    the containers that miss any of its inputs.
+
+    Attributes:
+        definitions (list): The derived metrics as defined in the `DERIVED_METRICS_LIST`
+        inputs (set): The names of the metrics that are needed by the derived metrics
+
+    Methods:
+        add(container_id, metric_name, timestamp, value): collect a value of an input metric
+        compute(): compute the derived metrics of all the containers
+    """
+
+    def __init__(self, definitions):
+        """Class Constructor."""
+        self.definitions = definitions
+        self.inputs = set()
+        for definition in definitions:
+            self.inputs.update((definition['numerator'], definition['denominator']))
+        self.__containers = {}
+        self.__container_ids = []
+        self.__timestamps = []
+        self.__columns = {metric_name: ([], []) for metric_name in self.inputs}
+
+    def add(self, container_id, metric_name, timestamp, value):
+        """ Collect the (latest) value of an input metric of a container
+
+        Args:
+            container_id (str): The container ID
+            metric_name (str): The name of the input metric
+            timestamp (str): The datetime of the value
+            value (str|float): The value
+
+        Returns:
+            None
+        """
+        index = self.__containers.get(container_id)
+        if index is None:
+            index = self.__containers[container_id] = len(self.__container_ids)
+            self.__container_ids.append(container_id)
+            self.__timestamps.append(timestamp)
+        else:
+            self.__timestamps[index] = timestamp
+        indices, values = self.__columns[metric_name]
+        indices.append(index)
+        values.append(value)
+
+    def compute(self):
+        """ Compute the derived metrics of all the containers
+
+        Returns:
+            list: the (container ID, derived metric definition, timestamp, value) tuples
+        """
+        if not self.__container_ids:
+            return []
+        if numpy is not None:
+            columns = self._numpy_columns()
+        else:
+            columns = self._python_columns()
+
+        derived_values = []
+        for definition in self.definitions:
+            numerators = columns[definition['numerator']]
+            denominators = columns[definition['denominator']]
+            scale = definition.get('scale', 1)
+            if numpy is not None:
+                valid = ~(numpy.isnan(numerators) | numpy.isnan(denominators))
+                with numpy.errstate(divide='ignore', invalid='ignore'):
+                    ratios = numpy.where(denominators == 0, 0.0,
+                                         numerators * scale / denominators)
+                indices = numpy.flatnonzero(valid).tolist()
+                ratios = ratios.tolist()
+            else:
+                indices, ratios = [], [None] * len(numerators)
+                for index, (numerator, denominator) in enumerate(zip(numerators, denominators)):
+                    if numerator is None or denominator is None:
+                        continue
+                    indices.append(index)
+                    ratios[index] = 0.0 if denominator == 0 else numerator * scale / denominator
+            missing = len(self.__container_ids) - len(indices)
+            if missing:
+                logger.debug("Skip the `{}` of {} containers with missing inputs".format(
+                    definition['name'], missing))
+            derived_values.extend((self.__container_ids[index], definition,
+                                   self.__timestamps[index], ratios[index])
+                                  for index in indices)
+        return derived_values
+
+    def _numpy_columns(self):
+        size = len(self.__container_ids)
+        columns = {}
+        for metric_name, (indices, values) in self.__columns.items():
+            column = numpy.full(size, numpy.nan)
+            if indices:
+                column[numpy.array(indices, dtype=numpy.intp)] = numpy.array(values, dtype=float)
+            columns[metric_name] = column
+        return columns
+
+    def _python_columns(self):
+        size = len(self.__container_ids)
+        columns = {}
+        for metric_name, (indices, values) in self.__columns.items():
+            column = [None] * size
+            for index, value in zip(indices, values):
+                column[index] = float(value)
+            columns[metric_name] = column
+        return columns
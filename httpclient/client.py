@@ -4,6 +4,8 @@ Implementation of the AbstractClient class
 
 import requests
 import requests.packages.urllib3
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 from .baseclient import AbstractClient
 
 requests.packages.urllib3.disable_warnings()
@@ -12,18 +14,41 @@ requests.packages.urllib3.disable_warnings()
 class Client(AbstractClient):
     """The HTTP Client class
 
+    The requests are performed through a `requests.Session`, so the TCP/TLS connections
+    are kept alive and re-used by the consecutive and the concurrent requests.
+
     Attributes:
         verify_ssl_cert (bool): True to verify the SSL cert. False otherwise.
+        timeout (float): The timeout (seconds) per request. None to wait forever.
 
     Methods:
         list(url, headers): get a list of entities
         get(url, headers): fetch an entity
         post(url, headers, payload): insert an entity
         delete(url, headers): delete an entity
+        close(): close the pooled connections
     """
 
-    def __init__(self, verify_ssl_cert=False):
+    def __init__(self, verify_ssl_cert=False, pool_size=10, max_retries=0, backoff_factor=0,
+                 timeout=None):
+        """Class Constructor.
+
+        Args:
+            verify_ssl_cert (bool): True to verify the SSL cert. False otherwise.
+            pool_size (int): The max number of pooled connections per host
+            max_retries (int): The max number of retries on connection errors and 502/503/504
+            backoff_factor (float): The backoff factor between the retries
+            timeout (float): The timeout (seconds) per request. None to wait forever.
+        """
         self.verify_ssl_cert = verify_ssl_cert
+        self.timeout = timeout
+        retries = Retry(total=max_retries, backoff_factor=backoff_factor,
+                        status_forcelist=(502, 503, 504), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retries)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         super(Client, self).__init__()
 
     def list(self, url, headers=None, **kwargs):
@@ -38,8 +63,10 @@ class Client(AbstractClient):
             obj: a requests object
         """
         query_params = kwargs.get('query_params', None)
-        response = requests.get(url, headers=headers, params=query_params,
-                                verify=self.verify_ssl_cert)
+        response = self.session.get(url, headers=headers, params=query_params,
+                                    verify=self.verify_ssl_cert,
+                                    timeout=kwargs.get('timeout', self.timeout),
+                                    stream=kwargs.get('stream', False))
         return response
 
     def get(self, url, headers=None, **kwargs):
@@ -54,8 +81,10 @@ class Client(AbstractClient):
             obj: a requests object
         """
         query_params = kwargs.get('query_params', None)
-        response = requests.get(url, headers=headers, params=query_params,
-                                verify=self.verify_ssl_cert)
+        response = self.session.get(url, headers=headers, params=query_params,
+                                    verify=self.verify_ssl_cert,
+                                    timeout=kwargs.get('timeout', self.timeout),
+                                    stream=kwargs.get('stream', False))
         return response
 
     def post(self, url, headers=None, payload=None, **kwargs):
@@ -71,8 +100,9 @@ class Client(AbstractClient):
             obj: a requests object
         """
         query_params = kwargs.get('query_params', None)
-        response = requests.post(url, data=payload, headers=headers, params=query_params,
-                                 verify=self.verify_ssl_cert)
+        response = self.session.post(url, data=payload, headers=headers, params=query_params,
+                                     verify=self.verify_ssl_cert,
+                                     timeout=kwargs.get('timeout', self.timeout))
         return response
 
     def delete(self, url, headers=None, **kwargs):
@@ -87,6 +117,11 @@ class Client(AbstractClient):
             obj: a requests object
         """
         query_params = kwargs.get('query_params', None)
-        response = requests.delete(url=url, headers=headers, params=query_params,
-                                   verify=self.verify_ssl_cert)
+        response = self.session.delete(url=url, headers=headers, params=query_params,
+                                       verify=self.verify_ssl_cert,
+                                       timeout=kwargs.get('timeout', self.timeout))
         return response
+
+    def close(self):
+        """Close the pooled connections."""
+        self.session.close()
@@ -0,0 +1,354 @@
+"""
+A module that keeps the metrics of the publisher itself and serves them in the Prometheus
+text exposition format.
+"""
+
+import logging.config
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from settings import LOGGING
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label_value(value):
+    """ Escape a label value as required by the text exposition format
+
+    Args:
+        value (str): The label value
+
+    Returns:
+        str: the escaped value
+    """
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=()):
+    """ Format the given labels, e.g. `{metric="x",le="0.5"}`
+
+    Args:
+        names (tuple): The label names
+        values (tuple): The label values
+        extra (tuple): Additional (name, value) pairs
+
+    Returns:
+        str: the formatted labels or an empty string if there are none
+    """
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, escape_label_value(value))
+                          for name, value in pairs) + "}"
+
+
+def format_value(value):
+    """ Format a sample value
+
+    Args:
+        value (float): The value
+
+    Returns:
+        str: the formatted value
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Registry(object):
+    """Registry Class.
+
+    Methods:
+        register(metric): add a metric in the registry
+        expose(): get the samples of all the metrics in the text exposition format
+    """
+
+    def __init__(self):
+        """Class Constructor."""
+        self.__metrics = []
+        self.__lock = threading.Lock()
+
+    def register(self, metric):
+        """ Add a metric in the registry
+
+        Args:
+            metric (object): The Counter, Gauge or Histogram object
+
+        Returns:
+            None
+        """
+        with self.__lock:
+            self.__metrics.append(metric)
+
+    def expose(self):
+        """ Get the samples of all the metrics in the text exposition format
+
+        Returns:
+            bytes: the exposition
+        """
+        with self.__lock:
+            metrics = list(self.__metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+REGISTRY = Registry()
+
+
+class Metric(object):
+    """Metric Class.
+
+    The base class of the metrics; a metric keeps a child (i.e. a set of values) per
+    combination of label values. The methods of a metric without labels are applied to its
+    single child.
+
+    Attributes:
+        name (str): The name of the metric
+        documentation (str): The help text of the metric
+        labelnames (tuple): The names of the labels
+
+    Methods:
+        labels(*values): get the child of the given label values
+        expose(): get the samples of the metric in the text exposition format
+    """
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        """Class Constructor."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self.__children = {}
+        if not self.labelnames:
+            self.__children[()] = self._new_child()
+        registry.register(self)
+
+    def labels(self, *values):
+        """ Get the child of the given label values, creating it if it is missing
+
+        Args:
+            *values (str): The label values, in the order of the `labelnames`
+
+        Returns:
+            object: the child
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError("Expected the values of the labels {}".format(self.labelnames))
+        values = tuple(str(value) for value in values)
+        child = self.__children.get(values)
+        if child is None:
+            with self._lock:
+                child = self.__children.setdefault(values, self._new_child())
+        return child
+
+    def expose(self):
+        """ Get the samples of the metric in the text exposition format
+
+        Returns:
+            list: the lines
+        """
+        lines = ["# HELP {} {}".format(self.name, self.documentation.replace("\n", " ")),
+                 "# TYPE {} {}".format(self.name, self.kind)]
+        with self._lock:
+            children = sorted(self.__children.items())
+        for values, child in children:
+            lines.extend(self._expose_child(values, child))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _expose_child(self, values, child):
+        raise NotImplementedError
+
+
+class _Value(object):
+    """ A float value that is updated atomically """
+
+    def __init__(self):
+        self.value = 0.0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def set(self, value):
+        with self.lock:
+            self.value = float(value)
+
+
+class Counter(Metric):
+    """Counter Class.
+
+    A value that only increases, e.g. the number of the published messages.
+    """
+    kind = "counter"
+
+    def inc(self, amount=1):
+        """ Increase the counter (without labels) by the given amount """
+        self.labels().inc(amount)
+
+    def _new_child(self):
+        return _Value()
+
+    def _expose_child(self, values, child):
+        return ["{}{} {}".format(self.name, format_labels(self.labelnames, values),
+                                 format_value(child.value))]
+
+
+class Gauge(Counter):
+    """Gauge Class.
+
+    A value that goes up and down, e.g. the size of the spool.
+    """
+    kind = "gauge"
+
+    def set(self, value):
+        """ Set the gauge (without labels) to the given value """
+        self.labels().set(value)
+
+
+class _HistogramValue(object):
+    """ The bucket counters, the sum and the count of the observations """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            for index, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    self.counts[index] += 1
+                    break
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(Metric):
+    """Histogram Class.
+
+    The distribution of the observations (e.g. latencies) in cumulative buckets.
+
+    Attributes:
+        buckets (tuple): The upper bounds of the buckets; the `+Inf` is always included
+    """
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        """Class Constructor."""
+        self.buckets = tuple(sorted(float(bucket) for bucket in buckets)) + (float("inf"),)
+        super(Histogram, self).__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value):
+        """ Add an observation in the histogram (without labels) """
+        self.labels().observe(value)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _expose_child(self, values, child):
+        with child.lock:
+            counts, total, count = list(child.counts), child.sum, child.count
+        lines = []
+        cumulative = 0
+        for upper_bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append("{}_bucket{} {}".format(
+                self.name, format_labels(self.labelnames, values,
+                                         (("le", format_value(upper_bound)),)), cumulative))
+        labels = format_labels(self.labelnames, values)
+        lines.append("{}_sum{} {}".format(self.name, labels, format_value(total)))
+        lines.append("{}_count{} {}".format(self.name, labels, count))
+        return lines
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """ Serve the `/metrics` of the registry """
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.expose()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("Metrics endpoint: " + format % args)
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """ An HTTP server that handles each request in a thread """
+    daemon_threads = True
+
+
+def start_http_server(port, address=""):
+    """ Serve the metrics on the given port in a daemon thread
+
+    Args:
+        port (int): The port
+        address (str): The address to bind; by default, all the interfaces
+
+    Returns:
+        object: the HTTP server
+    """
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True)
+    thread.start()
+    logger.info("Serving the publisher metrics on port {}".format(port))
+    return server
+
+
+# The metrics of the publisher
+CYCLE_DURATION = Histogram(
+    "publisher_cycle_duration_seconds", "The duration of the collection cycles",
+    buckets=(.5, 1, 2.5, 5, 10, 15, 20, 30, 60, 120))
+CYCLE_OVERRUNS = Counter(
+    "publisher_cycle_overruns_total",
+    "The ticks skipped because the previous cycle was still running")
+LAST_CYCLE_COMPLETED = Gauge(
+    "publisher_last_cycle_completed_timestamp_seconds",
+    "The unix timestamp when the latest cycle completed")
+QUERY_DURATION = Histogram(
+    "publisher_query_duration_seconds",
+    "The latency of the Prometheus queries per metric, until their response (or the headers "
+    "of a streamed one) is received", ("metric",))
+QUERY_RESPONSE_SIZE = Histogram(
+    "publisher_query_response_bytes", "The size of the Prometheus responses per metric",
+    ("metric",), buckets=(1e3, 1e4, 1e5, 1e6, 1e7, 1e8))
+QUERY_FAILURES = Counter(
+    "publisher_query_failures_total", "The failed Prometheus queries per metric", ("metric",))
+SERIES_PARSED = Counter(
+    "publisher_series_parsed_total", "The series parsed from the Prometheus responses",
+    ("metric",))
+MESSAGES = Counter(
+    "publisher_messages_total",
+    "The kafka messages by status (published, acked, failed, spooled, replayed, "
+    "suppressed)", ("status",))
+KAFKA_SEND_DURATION = Histogram(
+    "publisher_kafka_send_duration_seconds",
+    "The latency from the publishing of a message until its acknowledgement by the broker")
+SPOOL_BYTES = Gauge(
+    "publisher_spool_bytes", "The size of the messages kept in the disk-backed spool")
+REMOTE_WRITE_REQUESTS = Counter(
+    "publisher_remote_write_requests_total",
+    "The remote_write requests received from Prometheus by status (ok, invalid, failed)",
+    ("status",))
@@ -0,0 +1,51 @@
+"""
+Module that implements the partitioners of the kafka messages
+"""
+
+import random
+import zlib
+
+
+class Crc32Partitioner(object):
+    """Crc32Partitioner Class.
+
+    It maps a key to `crc32(key) % partitions`, the same hash as the one of the sharding of
+    the publisher (see `sharding.get_shard`) and of the `consistent` partitioner of
+    librdkafka, so the partition of a container is predictable by the consumers. The
+    messages without key go to a random available partition.
+    """
+
+    def __call__(self, key, all_partitions, available):
+        """ Select the partition of a message
+
+        Args:
+            key (bytes): The serialized key of the message
+            all_partitions (list): The sorted partitions of the topic
+            available (list): The partitions that have a leader
+
+        Returns:
+            int: the partition
+        """
+        if key is None:
+            return random.choice(available or all_partitions)
+        return all_partitions[zlib.crc32(key) % len(all_partitions)]
+
+
+def get_partitioner(name):
+    """ Get the partitioner of the kafka producer by its name
+
+    Args:
+        name (str): Either `default` (the murmur2 partitioner of kafka-python, compatible with
+            the Java client) or `crc32`
+
+    Returns:
+        object: the partitioner or None for the default one
+
+    Raises:
+        ValueError: if the partitioner is unknown
+    """
+    if name in ("", "default", "murmur2"):
+        return None
+    if name == "crc32":
+        return Crc32Partitioner()
+    raise ValueError("Unknown kafka partitioner `{}`".format(name))
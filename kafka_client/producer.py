@@ -0,0 +1,350 @@
+"""
+Module that implements a long-lived kafka producer
+"""
+
+import logging.config
+import threading
+import time
+from collections import Counter
+
+from kafka import KafkaProducer, codec
+from kafka.errors import KafkaError, KafkaTimeoutError
+
+from instrumentation import MESSAGES, KAFKA_SEND_DURATION
+from kafka_client.partitioners import get_partitioner
+from kafka_client.serializers import JsonSerializer, serialize_key
+from settings import LOGGING, KAFKA_SERVER, KAFKA_API_VERSION, KAFKA_KUBERNETES_TOPIC, \
+    KAFKA_JSON_BACKEND, KAFKA_COMPRESSION_TYPE, KAFKA_BATCH_SIZE, KAFKA_LINGER_MS, \
+    KAFKA_BUFFER_MEMORY, KAFKA_ACKS, KAFKA_MAX_BLOCK_MS, KAFKA_KEY_STRATEGY, KAFKA_PARTITIONER
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+
+# The compression types supported by the pinned kafka-python and the probes of their libraries
+COMPRESSION_CODECS = {"gzip": codec.has_gzip, "snappy": codec.has_snappy, "lz4": codec.has_lz4}
+
+
+def validate_compression_type(compression_type=KAFKA_COMPRESSION_TYPE):
+    """ Check that the compression type is supported and that its library is installed, so a
+    misconfigured producer fails at startup instead of in every cycle
+
+    Args:
+        compression_type (str): Either `none`, `gzip`, `snappy` or `lz4`
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: if the compression type is unknown or its library is not installed
+    """
+    if compression_type in ("", "none"):
+        return
+    if compression_type not in COMPRESSION_CODECS:
+        raise ValueError("Invalid kafka compression type `{}`".format(compression_type))
+    if not COMPRESSION_CODECS[compression_type]():
+        raise ValueError("The library of the `{}` kafka compression is not installed".format(
+            compression_type))
+
+
+def get_producer_configs():
+    """ Get the batching, compression, acknowledgement and partitioning configs of the producer
+
+    Returns:
+        dict: the keyword arguments of the KafkaProducer
+    """
+    configs = {
+        "compression_type": None if KAFKA_COMPRESSION_TYPE in ("", "none") else
+        KAFKA_COMPRESSION_TYPE,
+        "batch_size": KAFKA_BATCH_SIZE,
+        "linger_ms": KAFKA_LINGER_MS,
+        "buffer_memory": KAFKA_BUFFER_MEMORY,
+        "acks": KAFKA_ACKS if KAFKA_ACKS == "all" else int(KAFKA_ACKS),
+        "max_block_ms": KAFKA_MAX_BLOCK_MS,
+    }
+    partitioner = get_partitioner(KAFKA_PARTITIONER)
+    if partitioner is not None:
+        configs["partitioner"] = partitioner
+    return configs
+
+
+def get_message_key(container_id, metric_name=None, strategy=KAFKA_KEY_STRATEGY):
+    """ Get the key of a message by the `KAFKA_KEY_STRATEGY`
+
+    Args:
+        container_id (str): The container ID of the message
+        metric_name (str, optional): The metric of the message (if it is a per metric one)
+        strategy (str): Either `container_id`, `container_metric` or `none`
+
+    Returns:
+        str: the key or None if the messages are not keyed
+    """
+    if strategy == "container_id":
+        return container_id
+    if strategy == "container_metric":
+        return container_id if metric_name is None else \
+            "{}/{}".format(container_id, metric_name)
+    return None
+
+
+class Producer(object):
+    """Producer Class.
+
+    It owns a single `KafkaProducer` that is re-used across the scheduler cycles. The
+    producer is created lazily and it is re-created transparently if a cycle detects that
+    the broker is unreachable. If a spool is given, the messages that are not published are
+    kept in it and they are replayed once the broker is reachable again. The messages may be
+    published from many threads.
+
+    Attributes:
+        topic (str): The kafka topic where the messages are published
+        spool (object, optional): The kafka_client.spool.Spool object
+        counters (Counter): The acked/failed/spooled/replayed messages since the latest flush
+
+    Methods:
+        connect(): create the kafka producer if it is missing or unhealthy
+        publish(payload, key): publish a message without waiting for the acknowledgement
+        replay(max_messages): re-publish the oldest spooled messages
+        flush(timeout): wait for the in-flight messages and check the producer health
+        close(): close the kafka producer
+    """
+
+    def __init__(self, topic=KAFKA_KUBERNETES_TOPIC, spool=None):
+        """Class Constructor."""
+        self.topic = topic
+        self.spool = spool
+        self.counters = Counter()
+        self.__lock = threading.Lock()
+        # Guards the creation, the sends and the closing of the KafkaProducer, as many threads
+        # publish through the same producer (e.g. the handlers of the remote_write server); the
+        # delivery callbacks take only the `__lock`, so they never wait for it
+        self.__producer_lock = threading.RLock()
+        self.__producer = None
+        self.__serializer = JsonSerializer(KAFKA_JSON_BACKEND)
+        self.__delivered = False
+        # The replayed messages that were acknowledged since the latest flush
+        self.__replay_acked = 0
+        # Set when the bus did not answer in this cycle, so the rest of the messages of the
+        # cycle are spooled without blocking on it again
+        self.__unavailable = False
+
+    def connect(self):
+        """ Create the kafka producer if it is missing and check that the broker is reachable
+
+        As the `api_version` is given, the KafkaProducer does not contact the broker when it
+        is created; the check fetches the partitions of the topic instead. A producer that
+        fails the check is closed; an unhealthy one is closed by `flush()`. Either way, it is
+        re-created in the next call.
+
+        Returns:
+            bool: True if the producer is available. False otherwise.
+        """
+        with self.__producer_lock:
+            if self.__producer is not None:
+                return True
+            try:
+                producer = KafkaProducer(
+                    bootstrap_servers=KAFKA_SERVER, api_version=KAFKA_API_VERSION,
+                    value_serializer=self.__serializer, key_serializer=serialize_key,
+                    **get_producer_configs())
+            except KafkaError as ex:
+                error_logger.error("Unable to connect to the kafka bus {}: {}".format(
+                    KAFKA_SERVER, ex))
+                self.__unavailable = True
+                return False
+            try:
+                producer.partitions_for(self.topic)
+            except KafkaError as ex:
+                error_logger.error("Unable to reach the kafka bus {}: {}".format(KAFKA_SERVER, ex))
+                self.__unavailable = True
+                try:
+                    producer.close(timeout=0)
+                except KafkaError as ex:
+                    error_logger.error(ex)
+                return False
+            self.__producer = producer
+            logger.info("Connected to the kafka bus {}".format(KAFKA_SERVER))
+            return True
+
+    def publish(self, payload, key=None):
+        """ Publish the payload in kafka bus without waiting for the broker acknowledgement
+
+        The delivery result is reported through the delivery callbacks, so many messages
+        are kept in-flight. Call `flush()` to wait for them. Once the bus is found unavailable
+        (it is unreachable or a send timed out), the messages are spooled (if a spool is given)
+        until the next `flush()`, without blocking on the bus again.
+
+        Args:
+            payload (dict|bytes): The message to be published, either as a dict or already
+                encoded as JSON
+            key (str|bytes, optional): The key of the message (see `get_message_key`); the
+                messages of the same key are published in the same partition
+
+        Returns:
+            None
+        """
+        self.__send(payload, key)
+
+    def __send(self, payload, key, replayed=False):
+        """ Send a message; a replayed one that fails is not spooled again (see `replay()`) """
+        with self.__producer_lock:
+            if self.__unavailable:
+                self.__fail(payload, key, replayed)
+                return
+            if not self.connect():
+                self._on_send_error(payload, key,
+                                    KafkaError("The kafka producer is not available"),
+                                    replayed=replayed)
+                return
+            try:
+                request = self.__producer.send(self.topic, payload, key=key)
+            except KafkaTimeoutError as ex:
+                self.__unavailable = True
+                self._on_send_error(payload, key, ex, replayed=replayed)
+                return
+            except KafkaError as ex:
+                self._on_send_error(payload, key, ex, replayed=replayed)
+                return
+            MESSAGES.labels("published").inc()
+            request.add_callback(self._on_send_success, time.time(), replayed=replayed)
+            request.add_errback(self._on_send_error, payload, key, replayed=replayed)
+
+    def replay(self, max_messages):
+        """ Re-publish up to the given number of the oldest spooled messages
+
+        The messages are replayed only if the messages of the previous flush were delivered,
+        so a still unreachable broker is not flooded; the number of messages per call limits
+        the replay, so it does not starve the live messages. The replayed messages are
+        consumed from the spool by the next `flush()`, only if all of them are acknowledged;
+        otherwise they are replayed again, so none of them is lost by a failure or a restart.
+
+        Args:
+            max_messages (int): The max number of messages to replay
+
+        Returns:
+            int: the number of the replayed messages
+        """
+        if self.spool is None or not self.__delivered or self.__unavailable or \
+                not self.connect():
+            return 0
+        records = self.spool.read(max_messages)
+        for key, value in records:
+            self.__send(value, key, replayed=True)
+        with self.__lock:
+            self.counters["replayed"] += len(records)
+        MESSAGES.labels("replayed").inc(len(records))
+        return len(records)
+
+    def flush(self, timeout=None):
+        """ Wait for the in-flight messages, consume the replayed messages from the spool if
+        all of them were acknowledged and reset the counters
+
+        If no message was acknowledged while some failed, the broker is considered
+        unreachable and the producer is closed; it is re-created in the next `publish()`,
+        which tries the bus again.
+
+        Args:
+            timeout (int, optional): Max seconds to wait for the in-flight messages
+
+        Returns:
+            Counter: the acked/failed/spooled/replayed messages since the previous flush
+        """
+        # The other threads keep publishing while the in-flight messages are awaited
+        with self.__producer_lock:
+            producer = self.__producer
+        if producer is not None:
+            try:
+                producer.flush(timeout=timeout)
+            except KafkaError as ex:
+                error_logger.error(ex)
+                self.close()
+
+        with self.__lock:
+            counters = self.counters
+            self.counters = Counter()
+            replay_acked = self.__replay_acked
+            self.__replay_acked = 0
+
+        if self.spool is not None and counters["replayed"]:
+            if replay_acked == counters["replayed"]:
+                self.spool.commit()
+            else:
+                self.spool.rollback()
+
+        self.__unavailable = False
+        self.__delivered = self.__producer is not None and not counters["failed"]
+        if counters["failed"] and not counters["acked"]:
+            self.close()
+        return counters
+
+    def close(self):
+        """ Close the kafka producer
+
+        Returns:
+            None
+        """
+        with self.__producer_lock:
+            if self.__producer is None:
+                return
+            try:
+                self.__producer.close(timeout=0)
+            except KafkaError as ex:
+                error_logger.error(ex)
+            self.__producer = None
+            logger.warning("Closed the connection with the kafka bus {}".format(KAFKA_SERVER))
+
+    def _on_send_success(self, sent_at, record_metadata, replayed=False):
+        """ Count a message acknowledged by the kafka broker and observe its latency
+
+        The callback is invoked by the I/O thread of the kafka producer.
+
+        Args:
+            sent_at (float): The unix timestamp when the message was published
+            record_metadata (object): The metadata of the published record
+            replayed (bool): True if the message was replayed from the spool
+
+        Returns:
+            None
+        """
+        KAFKA_SEND_DURATION.observe(time.time() - sent_at)
+        MESSAGES.labels("acked").inc()
+        with self.__lock:
+            self.counters["acked"] += 1
+            if replayed:
+                self.__replay_acked += 1
+
+    def _on_send_error(self, payload, key, ex, replayed=False):
+        """ Log and count a message that was not published in the kafka bus and keep it in
+        the spool (if any), along with its key
+
+        Args:
+            payload (dict|bytes): The message
+            key (str|bytes): The key of the message (if any)
+            ex (Exception): The exception raised by the kafka producer
+            replayed (bool): True if the message was replayed from the spool, where it is
+                still kept
+
+        Returns:
+            None
+        """
+        error_logger.error(ex)
+        self.__fail(payload, key, replayed)
+
+    def __fail(self, payload, key, replayed=False):
+        """ Count a message that was not published and keep it in the spool (if any) """
+        spooled = replayed
+        if self.spool is not None and not replayed:
+            self.spool.append(self.__serializer(payload), serialize_key(key))
+            spooled = True
+        with self.__lock:
+            self.counters["failed"] += 1
+            if spooled:
+                self.counters["spooled"] += 1
+        MESSAGES.labels("failed").inc()
+        if spooled:
+            MESSAGES.labels("spooled").inc()
+
+
+# Fail at startup if the compression type is invalid
+validate_compression_type()
@@ -0,0 +1,191 @@
+"""
+Module that implements the serialization of the kafka messages
+"""
+
+import json
+from json.encoder import encode_basestring_ascii
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def get_json_dumps(backend="auto"):
+    """ Get a function that serializes a value as JSON (bytes)
+
+    Args:
+        backend (str): One of `orjson`, `ujson`, `json` or `auto`. The `auto` picks the fastest
+            installed backend and falls back to the standard library.
+
+    Returns:
+        function: the function that serializes a value
+
+    Raises:
+        ValueError: if the requested backend is not installed or not supported
+    """
+    if backend in ("auto", "orjson") and orjson is not None:
+        return orjson.dumps
+    if backend in ("auto", "ujson") and ujson is not None:
+        return lambda value: ujson.dumps(value, ensure_ascii=False).encode('utf-8')
+    if backend in ("auto", "json"):
+        return lambda value: json.dumps(value, separators=(',', ':')).encode('utf-8')
+    raise ValueError("The JSON backend `{}` is not available".format(backend))
+
+
+def get_json_scalar_dumps(backend="auto"):
+    """ Get a function that serializes a scalar (str, int, float) as JSON (bytes)
+
+    The standard library fallback encodes the strings directly through the (C accelerated)
+    string encoder of the `json` module, avoiding the overhead of `json.dumps` per value.
+
+    Args:
+        backend (str): One of `orjson`, `ujson`, `json` or `auto` (see `get_json_dumps`)
+
+    Returns:
+        function: the function that serializes a scalar
+    """
+    dumps = get_json_dumps(backend)
+    if orjson is not None and dumps is orjson.dumps:
+        return dumps
+
+    def dumps_scalar(value):
+        if isinstance(value, str):
+            return encode_basestring_ascii(value).encode('ascii')
+        return dumps(value)
+    return dumps_scalar
+
+
+class JsonSerializer(object):
+    """JsonSerializer Class.
+
+    The `value_serializer` of the kafka producer. The already encoded payloads (bytes) are
+    published as they are.
+
+    Attributes:
+        dumps (function): The function that serializes a value as JSON (bytes)
+    """
+
+    def __init__(self, backend="auto"):
+        """Class Constructor."""
+        self.dumps = get_json_dumps(backend)
+
+    def __call__(self, value):
+        """ Serialize the given value
+
+        Args:
+            value (dict|bytes): The message to be published
+
+        Returns:
+            bytes: the serialized message
+        """
+        if isinstance(value, (bytes, bytearray)):
+            return bytes(value)
+        return self.dumps(value)
+
+
+def serialize_key(key):
+    """ The `key_serializer` of the kafka producer: the keys are published as UTF-8 bytes and
+    the already encoded keys (e.g. the spooled ones) as they are
+
+    Args:
+        key (str|bytes): The key of the message
+
+    Returns:
+        bytes: the serialized key or None if the message has no key
+    """
+    if key is None or isinstance(key, bytes):
+        return key
+    return str(key).encode('utf-8')
+
+
+class MetricPayloadEncoder(object):
+    """MetricPayloadEncoder Class.
+
+    It encodes the per metric messages, i.e.
+    `{"container_id": .., "type": .., "data": [{"timestamp": .., "unit": .., "type": ..,
+    "name": .., "value": ..}]}`, and the per container messages, i.e.
+    `{"schema_version": .., "container_id": .., "data": [..]}`, as JSON. The constant parts
+    of each metric (`type`, `unit`, `name`) are encoded once, so only the container ID, the
+    timestamps and the values are serialized per message.
+
+    The per metric messages of the derived metrics (e.g. the packet loss) keep the shape that
+    the consumers route on: the `type` of the message is the name of the metric and the
+    values are numbers, whether they are evaluated in Prometheus or in the publisher.
+
+    Methods:
+        encode(container_id, metric_name, samples): encode a message of the given metric
+        encode_sample(metric_name, timestamp, value): encode an item of the `data` list
+        encode_container(container_id, encoded_samples, schema_version): encode a message of
+            the given container
+    """
+
+    def __init__(self, metrics, backend="auto"):
+        """Class Constructor.
+
+        Args:
+            metrics (list): The metrics as defined in the `PROMETHEUS_METRICS_LIST` or the
+                entries of the metric registry, whose `derived` flag marks the derived metrics
+            backend (str): The JSON backend (see `get_json_dumps`)
+        """
+        self.dumps = get_json_scalar_dumps(backend)
+        self.__fragments = {}
+        for metric in metrics:
+            derived = metric.get('derived', False)
+            metric_type = self.dumps(metric['type'])
+            payload_head = b',"type":' + (self.dumps(metric['name']) if derived else
+                                          metric_type) + b',"data":['
+            sample_head = b',"unit":' + self.dumps(metric['unit']) + b',"type":' + metric_type + \
+                          b',"name":' + self.dumps(metric['name']) + b',"value":'
+            self.__fragments[metric['name']] = (payload_head, sample_head, derived)
+
+    def encode(self, container_id, metric_name, samples):
+        """ Encode a message of the given metric
+
+        Args:
+            container_id (str): The container ID
+            metric_name (str): The name of the metric
+            samples (list): The (timestamp, value) tuples of the message
+
+        Returns:
+            bytes: the encoded message
+        """
+        payload_head = self.__fragments[metric_name][0]
+        data = b','.join(self.encode_sample(metric_name, timestamp, value)
+                         for timestamp, value in samples)
+        return b'{"container_id":' + self.dumps(container_id) + payload_head + data + b']}'
+
+    def encode_sample(self, metric_name, timestamp, value):
+        """ Encode an item of the `data` list
+
+        Args:
+            metric_name (str): The name of the metric
+            timestamp (str): The datetime of the value
+            value (str|float): The value
+
+        Returns:
+            bytes: the encoded item
+        """
+        _, sample_head, derived = self.__fragments[metric_name]
+        if derived:
+            value = float(value)
+        return b'{"timestamp":' + self.dumps(timestamp) + sample_head + self.dumps(value) + b'}'
+
+    def encode_container(self, container_id, encoded_samples, schema_version):
+        """ Encode a message that groups the samples of many metrics of a container
+
+        Args:
+            container_id (str): The container ID
+            encoded_samples (list): The items of the `data` list, as returned by `encode_sample`
+            schema_version (int): The version of the message schema
+
+        Returns:
+            bytes: the encoded message
+        """
+        return b'{"schema_version":' + self.dumps(schema_version) + b',"container_id":' + \
+            self.dumps(container_id) + b',"data":[' + b','.join(encoded_samples) + b']}'
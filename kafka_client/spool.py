@@ -0,0 +1,221 @@
+"""
+Module that implements a disk-backed spool of the messages that were not published
+"""
+
+import logging.config
+import os
+import struct
+import threading
+
+from settings import LOGGING
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+LENGTH = struct.Struct(">I")
+NO_KEY = 0xFFFFFFFF
+SEGMENT_SUFFIX = ".spool"
+OFFSET_SUFFIX = ".offset"
+
+
+class Spool(object):
+    """Spool Class.
+
+    The messages are appended to segment files in the given directory. Each record is the
+    (optional) key and the value of a message, both prefixed by their length. When the total
+    size exceeds `max_bytes`, the oldest segments are evicted. The records are replayed
+    oldest-first. The records that are read are consumed only through `commit()`, e.g. once
+    their replay is acknowledged; the replay offset of the oldest segment is then persisted
+    next to it, so a restarted service resumes the replay without losing any record.
+
+    Attributes:
+        directory (str): The directory of the segment files
+        segment_bytes (int): The size after which a new segment is started
+        max_bytes (int): The max total size of the segments
+
+    Methods:
+        append(value, key): append a message
+        read(max_records): read up to the given number of the oldest unread messages
+        commit(): consume the messages that were read
+        rollback(): discard the reads, so the messages are read again
+        size(): the total size of the segments (bytes)
+    """
+
+    def __init__(self, directory, segment_bytes=8 * 1024 * 1024, max_bytes=512 * 1024 * 1024):
+        """Class Constructor."""
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.__lock = threading.Lock()
+        self.__active = None
+        # The offset after the records that were read (None if all of them) per segment
+        self.__pending = {}
+        os.makedirs(directory, exist_ok=True)
+        self.__segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+        self.__sizes = {segment: os.path.getsize(self._path(segment))
+                        for segment in self.__segments}
+        if self.__segments:
+            logger.info("The spool {} includes {} bytes".format(directory, self.size()))
+
+    def append(self, value, key=None):
+        """ Append a message
+
+        Args:
+            value (bytes): The serialized message
+            key (bytes, optional): The serialized key of the message
+
+        Returns:
+            None
+        """
+        record = (LENGTH.pack(NO_KEY) if key is None else LENGTH.pack(len(key)) + key) + \
+            LENGTH.pack(len(value)) + value
+        with self.__lock:
+            try:
+                if self.__active is None or self.__active.tell() >= self.segment_bytes:
+                    self._rotate()
+                self.__active.write(record)
+                self.__active.flush()
+                self.__sizes[self.__segments[-1]] += len(record)
+            except OSError as ex:
+                error_logger.error("Unable to spool a message in {}: {}".format(self.directory,
+                                                                               ex))
+                return
+            self._evict()
+
+    def read(self, max_records):
+        """ Read up to the given number of the oldest messages that have not been read since
+        the latest `commit()` or `rollback()`
+
+        Args:
+            max_records (int): The max number of messages
+
+        Returns:
+            list: the (key, value) tuples of the messages
+        """
+        records = []
+        with self.__lock:
+            for segment in list(self.__segments):
+                if len(records) >= max_records:
+                    break
+                if segment in self.__pending and self.__pending[segment] is None:
+                    continue
+                if self.__active is not None and segment == self.__segments[-1]:
+                    # Seal the active segment, so it can be consumed
+                    self.__active.close()
+                    self.__active = None
+                offset = self.__pending[segment] if segment in self.__pending else \
+                    self._read_offset(segment)
+                try:
+                    with open(self._path(segment), "rb") as f:
+                        f.seek(offset)
+                        while len(records) < max_records:
+                            record = self._read_record(f)
+                            if record is None:
+                                break
+                            records.append(record)
+                        offset = f.tell()
+                        exhausted = self._read_record(f) is None
+                except OSError as ex:
+                    error_logger.error("Unable to read the spool segment {}: {}".format(segment,
+                                                                                       ex))
+                    exhausted = True
+                self.__pending[segment] = None if exhausted else offset
+        return records
+
+    def commit(self):
+        """ Consume the messages that were read: persist the replay offsets and remove the
+        segments that were read entirely
+
+        Returns:
+            None
+        """
+        with self.__lock:
+            for segment, offset in self.__pending.items():
+                if segment not in self.__segments:
+                    # Evicted meanwhile
+                    continue
+                if offset is None:
+                    self._remove(segment)
+                else:
+                    self._write_offset(segment, offset)
+            self.__pending = {}
+
+    def rollback(self):
+        """ Discard the reads since the latest commit, so the messages are read again
+
+        Returns:
+            None
+        """
+        with self.__lock:
+            self.__pending = {}
+
+    def size(self):
+        """ Get the total size of the segments
+
+        Returns:
+            int: the size in bytes
+        """
+        return sum(self.__sizes.values())
+
+    def _path(self, segment, suffix=SEGMENT_SUFFIX):
+        return os.path.join(self.directory, "{:020d}{}".format(segment, suffix))
+
+    def _rotate(self):
+        if self.__active is not None:
+            self.__active.close()
+        segment = self.__segments[-1] + 1 if self.__segments else 0
+        self.__active = open(self._path(segment), "ab")
+        self.__segments.append(segment)
+        self.__sizes[segment] = 0
+
+    def _evict(self):
+        while len(self.__segments) > 1 and self.size() > self.max_bytes:
+            segment = self.__segments[0]
+            error_logger.warning("The spool exceeds {} bytes; evict the segment {}".format(
+                self.max_bytes, segment))
+            self._remove(segment)
+
+    def _remove(self, segment):
+        self.__segments.remove(segment)
+        self.__sizes.pop(segment, None)
+        for suffix in (SEGMENT_SUFFIX, OFFSET_SUFFIX):
+            try:
+                os.remove(self._path(segment, suffix))
+            except OSError:
+                pass
+
+    def _read_offset(self, segment):
+        try:
+            with open(self._path(segment, OFFSET_SUFFIX)) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_offset(self, segment, offset):
+        try:
+            with open(self._path(segment, OFFSET_SUFFIX), "w") as f:
+                f.write(str(offset))
+        except OSError as ex:
+            error_logger.error("Unable to save the spool offset: {}".format(ex))
+
+    @staticmethod
+    def _read_record(f):
+        header = f.read(LENGTH.size)
+        if len(header) < LENGTH.size:
+            return None
+        key_length, = LENGTH.unpack(header)
+        key = None
+        if key_length != NO_KEY:
+            key = f.read(key_length)
+        header = f.read(LENGTH.size)
+        if len(header) < LENGTH.size:
+            return None
+        value_length, = LENGTH.unpack(header)
+        value = f.read(value_length)
+        if len(value) < value_length:
+            # A partially written record, e.g. the process was killed while appending
+            return None
+        return key, value
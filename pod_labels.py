@@ -0,0 +1,113 @@
+"""
+A module that keeps a local index of the OSM related pods.
+"""
+
+import logging.config
+import time
+import urllib.parse
+from settings import LOGGING
+from utils import execute_query
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+POD_LABELS_QUERY = 'max(kube_pod_labels{label_ow_action!=""}) by (label_ow_action, pod, label_vim_id)'
+
+
+class PodLabelsIndex(object):
+    """PodLabelsIndex Class.
+
+    It maps each pod to its `label_vim_id` and `label_ow_action`, so the per metric queries
+    skip the `kube_pod_labels` join and the results are enriched locally. The index is
+    re-loaded from the Prometheus API when it is older than `ttl` seconds.
+
+    Attributes:
+        ttl (int): The seconds after which the index is considered expired
+
+    Methods:
+        refresh(prom_ql, window): re-load the index if it is expired
+        lookup(pod): get the labels of a pod
+        enrich(results): add the pod labels in the results of a query without the join
+    """
+
+    def __init__(self, ttl):
+        """Class Constructor."""
+        self.ttl = ttl
+        self.__pods = {}
+        self.__loaded_at = None
+
+    def is_expired(self):
+        """ Check if the index has to be re-loaded
+
+        Returns:
+            bool: True if the index is expired. False otherwise.
+        """
+        return self.__loaded_at is None or time.time() - self.__loaded_at >= self.ttl
+
+    def refresh(self, prom_ql, window=None):
+        """ Re-load the index from the Prometheus API if it is expired
+
+        On failure, the previous index (if any) is kept.
+
+        Args:
+            prom_ql (object): The Query or the QueryRange object
+            window (tuple, optional): The start and the end unix timestamps of the cycle; the
+                labels are loaded at its end
+
+        Returns:
+            None
+        """
+        if not self.is_expired():
+            return
+
+        response = execute_query(prom_ql, urllib.parse.quote(POD_LABELS_QUERY), instant=True,
+                                 window=window)
+        if response.status_code != 200:
+            error_logger.error("GET {} - {}".format(response.url, response.text))
+            return
+
+        pods = {}
+        for result in response.json()['data'].get('result', []):
+            labels = result.get('metric', {})
+            if labels.get('pod') is None or labels.get('label_vim_id') is None:
+                continue
+            pods[labels['pod']] = (labels['label_vim_id'], labels.get('label_ow_action'))
+        # Swap the whole index, so the concurrent readers see either the old or the new one
+        self.__pods = pods
+        self.__loaded_at = time.time()
+        logger.debug("Loaded the labels of {} pods".format(len(pods)))
+
+    def lookup(self, pod):
+        """ Get the labels of a pod
+
+        Args:
+            pod (str): The name of the pod
+
+        Returns:
+            tuple: the `label_vim_id` and the `label_ow_action` or None if the pod is not
+                relevant with OSM
+        """
+        return self.__pods.get(pod)
+
+    def enrich(self, results):
+        """ Add the pod labels in the results of a query without the `kube_pod_labels` join
+
+        The results of the pods that are not relevant with OSM are skipped.
+
+        Args:
+            results (iterable): The `result` list of a query aggregated by the `pod_name`
+
+        Yields:
+            dict: each result having the `pod`, `label_vim_id` and `label_ow_action` labels
+        """
+        pods = self.__pods
+        for result in results:
+            labels = result.get('metric', {})
+            pod = labels.pop('pod_name', None)
+            if pod not in pods:
+                continue
+            labels['pod'] = pod
+            labels['label_vim_id'], labels['label_ow_action'] = pods[pod]
+            result['metric'] = labels
+            yield result
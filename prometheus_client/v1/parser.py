@@ -0,0 +1,109 @@
+"""
+Module that parses the responses of the Prometheus API incrementally
+"""
+
+import codecs
+import json
+import re
+
+RESULT_TYPE_PATTERN = re.compile(r'"resultType"\s*:\s*"(\w+)"')
+RESULT_START_PATTERN = re.compile(r'"result"\s*:\s*\[')
+WHITESPACE_AND_COMMA = " \t\n\r,"
+
+
+def stream_results(response, keep_last=False, chunk_size=64 * 1024):
+    """ Parse the `result` list of a (streamed) query or query_range response series by series
+
+    The body is read in chunks through `iter_content` and only the series that is currently
+    parsed is kept in memory, instead of materializing the whole response.
+
+    Args:
+        response (object): A requests object fetched with `stream=True`
+        keep_last (bool): True to keep only the latest value of each series
+        chunk_size (int): The size of the chunks to read from the response
+
+    Returns:
+        tuple: the result type (str) and a generator of the results (dict)
+
+    Raises:
+        ValueError: if the response does not include a `result` list
+    """
+    chunks = _iter_text(response, chunk_size)
+    buffer = ""
+    match = None
+    for chunk in chunks:
+        buffer += chunk
+        match = RESULT_START_PATTERN.search(buffer)
+        if match:
+            break
+    if match is None:
+        response.close()
+        raise ValueError("The response does not include a `result` list")
+
+    result_type = RESULT_TYPE_PATTERN.search(buffer[:match.start()])
+    result_type = result_type.group(1) if result_type else None
+    return result_type, _iter_results(response, chunks, buffer[match.end():], keep_last)
+
+
+def _iter_text(response, chunk_size):
+    """ Decode the chunks of the response body as UTF-8 text
+
+    Args:
+        response (object): A requests object fetched with `stream=True`
+        chunk_size (int): The size of the chunks to read from the response
+
+    Yields:
+        str: the decoded chunks
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def _iter_results(response, chunks, buffer, keep_last):
+    """ Decode the series of the `result` list one by one
+
+    Args:
+        response (object): A requests object fetched with `stream=True`
+        chunks (iterator): The remaining decoded chunks of the response body
+        buffer (str): The already read text after the opening bracket of the `result` list
+        keep_last (bool): True to keep only the latest value of each series
+
+    Yields:
+        dict: a series of the `result` list
+    """
+    decoder = json.JSONDecoder()
+    position = 0
+    try:
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE_AND_COMMA:
+                position += 1
+            if position < len(buffer) and buffer[position] == "]":
+                return
+            try:
+                result, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                # The series is incomplete; read at least as much of the body as the buffered
+                # part of the series, so a long series is decoded a few times instead of once
+                # per chunk
+                parts = [buffer[position:]]
+                missing = len(parts[0])
+                for chunk in chunks:
+                    parts.append(chunk)
+                    missing -= len(chunk)
+                    if missing <= 0:
+                        break
+                if len(parts) == 1:
+                    raise ValueError("The response ended in the middle of the `result` list")
+                buffer = "".join(parts)
+                position = 0
+                continue
+
+            if keep_last:
+                for key in ('values', 'histograms'):
+                    if key in result:
+                        result[key] = result[key][-1:]
+            yield result
+    finally:
+        response.close()
@@ -0,0 +1,57 @@
+"""
+Module that implements the (instant) Query requests in Prometheus API
+"""
+
+import logging.config
+
+import urllib3
+
+from httpclient.client import Client
+from settings import PROMETHEUS, LOGGING, PROMETHEUS_HTTP_POOL_SIZE, PROMETHEUS_HTTP_MAX_RETRIES, \
+    PROMETHEUS_HTTP_BACKOFF_FACTOR, PROMETHEUS_HTTP_TIMEOUT
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+
+
+class Query(object):
+    """Query Class.
+
+    Attributes:
+        bearer_token (str, optional): The Prometheus Authorization Token (if any)
+        stream (bool): True to defer the download of the response body, so it can be parsed
+            incrementally through `iter_content`
+
+    Methods:
+        get(query, time): perform an instant query request in Prometheus API
+    """
+
+    def __init__(self, token=None, stream=False):
+        """Class Constructor."""
+        self.__client = Client(verify_ssl_cert=False, pool_size=PROMETHEUS_HTTP_POOL_SIZE,
+                               max_retries=PROMETHEUS_HTTP_MAX_RETRIES,
+                               backoff_factor=PROMETHEUS_HTTP_BACKOFF_FACTOR,
+                               timeout=PROMETHEUS_HTTP_TIMEOUT)
+        self.bearer_token = token
+        self.stream = stream
+
+    def get(self, query, time=None):
+        """ Perform an instant query request in Prometheus API (PromQL)
+
+        Args:
+            query (str): The query
+            time (str, optional): The evaluation datetime. By default, the current server time.
+
+        Returns:
+            object: A requests object with a `vector` result
+        """
+        endpoint = 'http://{}:{}/api/v1/query'.format(PROMETHEUS.get('HOST'),
+                                                      PROMETHEUS.get('PORT'))
+        headers = {"Accept": "application/json"}
+        endpoint += "?query={}".format(query)
+        if time is not None:
+            endpoint += "&time={}".format(time)
+        logger.debug("Prometheus web service: {}".format(endpoint))
+        response = self.__client.get(url=endpoint, headers=headers, stream=self.stream)
+        return response
@@ -7,7 +7,8 @@ import logging.config
 import urllib3
 
 from httpclient.client import Client
-from settings import PROMETHEUS, LOGGING
+from settings import PROMETHEUS, LOGGING, PROMETHEUS_HTTP_POOL_SIZE, PROMETHEUS_HTTP_MAX_RETRIES, \
+    PROMETHEUS_HTTP_BACKOFF_FACTOR, PROMETHEUS_HTTP_TIMEOUT
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 logging.config.dictConfig(LOGGING)
@@ -19,15 +20,21 @@ class QueryRange(object):
 
     Attributes:
         bearer_token (str, optional): The Prometheus Authorization Token (if any)
+        stream (bool): True to defer the download of the response body, so it can be parsed
+            incrementally through `iter_content`
 
     Methods:
         get(query, from_time, to_time, step): perform a query_range request in Prometheus API
     """
 
-    def __init__(self, token=None):
+    def __init__(self, token=None, stream=False):
         """Class Constructor."""
-        self.__client = Client(verify_ssl_cert=False)
+        self.__client = Client(verify_ssl_cert=False, pool_size=PROMETHEUS_HTTP_POOL_SIZE,
+                               max_retries=PROMETHEUS_HTTP_MAX_RETRIES,
+                               backoff_factor=PROMETHEUS_HTTP_BACKOFF_FACTOR,
+                               timeout=PROMETHEUS_HTTP_TIMEOUT)
         self.bearer_token = token
+        self.stream = stream
 
     def get(self, query, from_time, to_time, step=14):
         """ Perform a query_range request in Prometheus API (PromQL)
@@ -46,5 +53,5 @@ class QueryRange(object):
         headers = {"Accept": "application/json"}
         endpoint += "?query={}&start={}&end={}&step={}".format(query, from_time, to_time, step)
         logger.debug("Prometheus web service: {}".format(endpoint))
-        response = self.__client.get(url=endpoint, headers=headers)
+        response = self.__client.get(url=endpoint, headers=headers, stream=self.stream)
         return response
@@ -0,0 +1,278 @@
+"""
+A module that keeps the metadata and the pre-built queries of the configured metrics.
+"""
+
+import re
+import urllib.parse
+from settings import PROMETHEUS_METRICS_LIST, DERIVED_METRICS_LIST, DERIVED_METRICS_MODE
+
+# The metrics that are aggregated per pod by their rate; the rest by their average over time
+RATE_METRICS = frozenset([
+    "container_network_receive_bytes_total",
+    "container_network_receive_errors_total",
+    "container_network_receive_packets_dropped_total",
+    "container_network_receive_packets_total",
+    "container_network_transmit_bytes_total",
+    "container_network_transmit_errors_total",
+    "container_network_transmit_packets_dropped_total",
+    "container_network_transmit_packets_total",
+    "container_cpu_usage_seconds_total",
+    "container_cpu_user_seconds_total",
+    "container_cpu_system_seconds_total",
+    "container_cpu_cfs_throttled_seconds_total",
+    "container_fs_writes_bytes_total",
+    "container_fs_reads_bytes_total",
+])
+
+METRIC_TYPES = ("gauge", "counter")
+METRIC_NAME_PATTERN = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+
+
+def get_metric_function(metric):
+    """ Select the function that aggregates the values of the given metric per pod
+
+    Args:
+        metric (str): The name of the metric
+
+    Returns:
+        str: the name of the function
+    """
+    if metric in RATE_METRICS:
+        return "rate"
+    return "avg_over_time"
+
+
+def aggregate_per_pod(metric, function):
+    """ Build the PromQL expression that aggregates the values of the given metric per pod
+
+    Args:
+        metric (str): The name of the metric
+        function (str): The name of the function applied in the values of each series
+
+    Returns:
+        str: the PromQL expression
+    """
+    return 'sum by (pod_name) (' \
+           '%(metric_function)s(%(metric_name)s{namespace="%(namespace)s"}[1m]))' \
+        % {"metric_function": function, "metric_name": metric, "namespace": "default"}
+
+
+def join_pod_labels(expression, by_labels=()):
+    """ Join the per pod expression with the `kube_pod_labels` to get the `label_vim_id` and
+    the `label_ow_action` of each pod
+
+    Args:
+        expression (str): A PromQL expression that is aggregated by the `pod_name`
+        by_labels (tuple): Additional labels of the expression to be kept in the result
+
+    Returns:
+        str: the PromQL query
+    """
+    return """sum(
+      max(kube_pod_labels{label_ow_action!=""}) by (label_ow_action, pod, label_vim_id)
+      *
+      on(pod)
+      group_right(label_ow_action, label_vim_id)
+      label_replace(
+        %(expression)s,
+        "pod",
+        "$1",
+        "pod_name",
+        "(.+)"
+      )
+    ) by (%(by_labels)s)""" \
+        % {"expression": expression,
+           "by_labels": ", ".join(("pod", "label_ow_action", "label_vim_id") + tuple(by_labels))}
+
+
+class MetricExpressions(dict):
+    """ The per pod PromQL expressions by metric name, built on demand for the `expression`
+    templates of the derived metrics """
+
+    def __missing__(self, metric):
+        if not METRIC_NAME_PATTERN.match(metric):
+            raise ValueError("Invalid metric `{}` in the expression".format(metric))
+        return aggregate_per_pod(metric, get_metric_function(metric))
+
+
+class MetricRegistry(object):
+    """MetricRegistry Class.
+
+    It is built once and keeps per metric name its type, unit, aggregation function and
+    per pod PromQL expression, along with its URL-quoted query with and without the
+    `kube_pod_labels` join, so the lookups are O(1) and the queries are not re-built in every
+    cycle. The configuration is validated on construction.
+
+    Attributes:
+        derived_mode (str): Either `promql` to evaluate the metrics that have an `expression`
+            in Prometheus or `client` to compute the derived metrics in the publisher
+
+    Methods:
+        get(metric): get the entry of the given metric
+        metrics(): get all the metrics
+        collected_metrics(): get the metrics that are queried from Prometheus
+        get_expression(metric): get the per pod PromQL expression of the given metric
+        get_query(metric, join): get the URL-quoted query of the given metric
+        get_batch_query(metrics, join): get the URL-quoted query of many metrics
+    """
+
+    def __init__(self, metrics, derived_metrics=(), derived_mode="promql"):
+        """Class Constructor.
+
+        Args:
+            metrics (list): The metrics as defined in the `PROMETHEUS_METRICS_LIST`
+            derived_metrics (list): The metrics that are computed in the publisher as defined
+                in the `DERIVED_METRICS_LIST`
+
+        Raises:
+            ValueError: if the configuration is invalid
+        """
+        if derived_mode not in ("promql", "client"):
+            raise ValueError("Invalid derived metrics mode `{}`".format(derived_mode))
+        self.derived_mode = derived_mode
+        self.__metrics = {}
+        self.__computed = set()
+        self.__batch_queries = {}
+        for metric in metrics:
+            self.__register(metric)
+        for definition in derived_metrics:
+            for input_name in (definition.get('numerator'), definition.get('denominator')):
+                if input_name not in self.__metrics:
+                    raise ValueError("The input `{}` of the derived metric `{}` is not in the "
+                                     "metrics list".format(input_name, definition.get('name')))
+            if not isinstance(definition.get('scale', 1), (int, float)):
+                raise ValueError("Invalid scale of the derived metric `{}`".format(
+                    definition.get('name')))
+            if definition.get('name') not in self.__metrics:
+                self.__register(definition, queried=False)
+            self.__metrics[definition['name']]['derived'] = True
+            self.__computed.add(definition['name'])
+
+    def __register(self, metric, queried=True):
+        """ Validate the given metric and pre-build its queries
+
+        Args:
+            metric (dict): The metric
+            queried (bool): False if the metric is never queried from Prometheus
+
+        Raises:
+            ValueError: if the metric is invalid
+        """
+        name = metric.get('name')
+        if not isinstance(name, str) or not METRIC_NAME_PATTERN.match(name):
+            raise ValueError("Invalid metric name `{}`".format(name))
+        if name in self.__metrics:
+            raise ValueError("The metric `{}` is defined more than once".format(name))
+        if metric.get('type') not in METRIC_TYPES:
+            raise ValueError("Invalid type `{}` of the metric `{}`".format(metric.get('type'),
+                                                                          name))
+        if not isinstance(metric.get('unit'), str):
+            raise ValueError("Invalid unit of the metric `{}`".format(name))
+
+        entry = {"name": name, "type": metric['type'], "unit": metric['unit'],
+                 "function": get_metric_function(name), "derived": False, "expression": None,
+                 "query": None, "joined_query": None}
+        if queried:
+            if 'expression' in metric and self.derived_mode == "promql":
+                try:
+                    expression = "({})".format(
+                        metric['expression'].format_map(MetricExpressions()))
+                except (KeyError, IndexError, ValueError) as ex:
+                    raise ValueError("Invalid expression of the metric `{}`: {}".format(name, ex))
+                entry['derived'] = True
+            else:
+                expression = aggregate_per_pod(name, entry['function'])
+            entry['expression'] = expression
+            entry['query'] = urllib.parse.quote(expression)
+            entry['joined_query'] = urllib.parse.quote(join_pod_labels(expression))
+        self.__metrics[name] = entry
+
+    def get(self, metric):
+        """ Get the entry of the given metric
+
+        Args:
+            metric (str): The name of the metric
+
+        Returns:
+            dict: the name, type, unit, function, derived (evaluated by its PromQL expression
+                template or computed in the publisher), expression, query and joined query of
+                the metric or None if it is unknown
+        """
+        return self.__metrics.get(metric)
+
+    def metrics(self):
+        """ Get all the metrics, including the ones that are computed in the publisher
+
+        Returns:
+            list: the entries of the metrics, in the configured order
+        """
+        return list(self.__metrics.values())
+
+    def collected_metrics(self):
+        """ Get the metrics that are queried from Prometheus, i.e. all of them except the ones
+        that are computed in the publisher
+
+        Returns:
+            list: the entries of the metrics, in the configured order
+        """
+        return [entry for name, entry in self.__metrics.items()
+                if entry['query'] is not None and name not in self.__computed]
+
+    def get_expression(self, metric):
+        """ Get the per pod PromQL expression of the given metric
+
+        Args:
+            metric (str): The name of the metric
+
+        Returns:
+            str: the PromQL expression
+        """
+        entry = self.__metrics.get(metric)
+        if entry is not None and entry['expression'] is not None:
+            return entry['expression']
+        return aggregate_per_pod(metric, get_metric_function(metric))
+
+    def get_query(self, metric, join=True):
+        """ Get the URL-quoted query of the given metric
+
+        Args:
+            metric (str): The name of the metric
+            join (bool): True to join the values with the `kube_pod_labels` in Prometheus
+
+        Returns:
+            str: the URL-quoted PromQL query
+        """
+        entry = self.__metrics.get(metric)
+        if entry is not None and entry['query'] is not None:
+            return entry['joined_query'] if join else entry['query']
+        expression = self.get_expression(metric)
+        return urllib.parse.quote(join_pod_labels(expression) if join else expression)
+
+    def get_batch_query(self, metrics, join=True):
+        """ Get the URL-quoted query that fetches many metrics in a single request
+
+        The expressions of the metrics are combined with the `or` operator and each one keeps
+        its metric name in the `metric_name` label. The query of each batch is built once.
+
+        Args:
+            metrics (list): The names of the metrics
+            join (bool): True to join the values with the `kube_pod_labels` in Prometheus
+
+        Returns:
+            str: the URL-quoted PromQL query
+        """
+        key = (tuple(metrics), join)
+        batch_query = self.__batch_queries.get(key)
+        if batch_query is None:
+            promql = " or ".join(
+                'label_replace({}, "metric_name", "{}", "", "")'.format(
+                    self.get_expression(metric), metric)
+                for metric in metrics)
+            if join:
+                promql = join_pod_labels("({})".format(promql), by_labels=("metric_name",))
+            batch_query = self.__batch_queries[key] = urllib.parse.quote(promql)
+        return batch_query
+
+
+metric_registry = MetricRegistry(PROMETHEUS_METRICS_LIST, DERIVED_METRICS_LIST,
+                                 DERIVED_METRICS_MODE)
@@ -0,0 +1,544 @@
+"""
+A module that receives the samples pushed by Prometheus (remote_write) and publishes them,
+as an alternative to polling the Prometheus API.
+"""
+
+import logging.config
+import math
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from derived import DerivedMetricsStage
+from instrumentation import SERIES_PARSED, REMOTE_WRITE_REQUESTS, SPOOL_BYTES
+from kafka_client.producer import get_message_key
+from registry import get_metric_function
+from sharding import owns_container
+from settings import LOGGING
+from utils import convert_unix_timestamp_to_datetime_str
+
+try:
+    import snappy
+except ImportError:
+    snappy = None
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+WRITE_PATH = "/api/v1/write"
+POD_LABELS_METRIC = "kube_pod_labels"
+NAMESPACE = "default"
+
+
+def read_uvarint(data, position):
+    """ Read an unsigned varint (protobuf, snappy)
+
+    Args:
+        data (bytes): The buffer
+        position (int): The position of the varint
+
+    Returns:
+        tuple: the value and the position after it
+
+    Raises:
+        ValueError: if the varint is truncated
+    """
+    result = shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError("Truncated varint")
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def snappy_decompress(data):
+    """ Decompress a snappy block (the format of the remote_write requests)
+
+    The python-snappy package is used if it is installed; otherwise the block is decoded in
+    pure Python.
+
+    Args:
+        data (bytes): The compressed block
+
+    Returns:
+        bytes: the uncompressed data
+
+    Raises:
+        ValueError: if the block is corrupted
+    """
+    if snappy is not None:
+        try:
+            return snappy.uncompress(data)
+        except snappy.UncompressError as ex:
+            raise ValueError("Invalid snappy block: {}".format(ex))
+
+    length, position = read_uvarint(data, 0)
+    output = bytearray()
+    while position < len(data):
+        tag = data[position]
+        position += 1
+        tag_type = tag & 0x03
+        if tag_type == 0:
+            # A literal; the length is either in the tag or in the next 1-4 bytes
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                if position + extra > len(data):
+                    raise ValueError("Truncated snappy literal")
+                size = int.from_bytes(data[position:position + extra], "little")
+                position += extra
+            size += 1
+            if position + size > len(data):
+                raise ValueError("Truncated snappy literal")
+            output += data[position:position + size]
+            position += size
+            continue
+        # A copy of `size` bytes from `offset` bytes back
+        if position + (1, 2, 4)[tag_type - 1] > len(data):
+            raise ValueError("Truncated snappy copy")
+        if tag_type == 1:
+            size = ((tag >> 2) & 0x07) + 4
+            offset = ((tag >> 5) << 8) | data[position]
+            position += 1
+        elif tag_type == 2:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[position:position + 2], "little")
+            position += 2
+        else:
+            size = (tag >> 2) + 1
+            offset = int.from_bytes(data[position:position + 4], "little")
+            position += 4
+        if offset == 0 or offset > len(output):
+            raise ValueError("Invalid snappy copy offset")
+        start = len(output) - offset
+        if size <= offset:
+            output += output[start:start + size]
+        else:
+            # The copy overlaps its own output, e.g. a repeated byte
+            for index in range(size):
+                output.append(output[start + index])
+    if len(output) != length:
+        raise ValueError("Invalid snappy length")
+    return bytes(output)
+
+
+def iter_protobuf_fields(data):
+    """ Iterate the fields of a protobuf message
+
+    Args:
+        data (bytes|memoryview): The encoded message
+
+    Yields:
+        tuple: the field number, the wire type and the value (int for the varints, bytes or
+            memoryview for the rest)
+
+    Raises:
+        ValueError: if the message is corrupted
+    """
+    position = 0
+    while position < len(data):
+        key, position = read_uvarint(data, position)
+        field_number, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, position = read_uvarint(data, position)
+        elif wire_type == 1:
+            value, position = data[position:position + 8], position + 8
+        elif wire_type == 2:
+            size, position = read_uvarint(data, position)
+            value, position = data[position:position + size], position + size
+        elif wire_type == 5:
+            value, position = data[position:position + 4], position + 4
+        else:
+            raise ValueError("Unsupported protobuf wire type {}".format(wire_type))
+        if position > len(data):
+            raise ValueError("Truncated protobuf field")
+        yield field_number, wire_type, value
+
+
+def decode_write_request(data):
+    """ Decode a `prometheus.WriteRequest` message
+
+    Only the fields used by the publisher are decoded: the labels and the samples of each
+    `TimeSeries`; the metadata and the exemplars are skipped.
+
+    Args:
+        data (bytes): The uncompressed message
+
+    Returns:
+        list: the (labels (dict), samples (list of (timestamp in ms, value))) per series
+
+    Raises:
+        ValueError: if the message is corrupted
+    """
+    data = memoryview(data)
+    series = []
+    for field_number, wire_type, timeseries in iter_protobuf_fields(data):
+        if field_number != 1 or wire_type != 2:
+            continue
+        labels, samples = {}, []
+        for ts_field, ts_wire_type, value in iter_protobuf_fields(timeseries):
+            if ts_wire_type != 2:
+                continue
+            if ts_field == 1:
+                name = label_value = ""
+                for label_field, _, label_data in iter_protobuf_fields(value):
+                    if label_field == 1:
+                        name = bytes(label_data).decode("utf-8")
+                    elif label_field == 2:
+                        label_value = bytes(label_data).decode("utf-8")
+                labels[name] = label_value
+            elif ts_field == 2:
+                sample_value, timestamp = 0.0, 0
+                for sample_field, sample_wire_type, sample_data in iter_protobuf_fields(value):
+                    if sample_field == 1 and sample_wire_type == 1:
+                        sample_value = struct.unpack("<d", sample_data)[0]
+                    elif sample_field == 2 and sample_wire_type == 0:
+                        # The int64 is encoded as a 64-bit two's complement varint
+                        timestamp = sample_data - (1 << 64) if sample_data >= 1 << 63 else \
+                            sample_data
+                samples.append((timestamp, sample_value))
+        series.append((labels, samples))
+    return series
+
+
+def format_sample_value(value):
+    """ Format a sample value as the Prometheus API does, e.g. "2092" or "0.5"
+
+    Args:
+        value (float): The value
+
+    Returns:
+        str: the formatted value
+    """
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class RemoteWriteIngester(object):
+    """RemoteWriteIngester Class.
+
+    It turns the raw series pushed by Prometheus into the same per pod values that the
+    queries of the polling mode return, i.e. `sum by (pod_name)` of the `rate` (counters,
+    computed between two consecutive samples of a series) or of the latest value (the rest)
+    of the series in the `default` namespace. The pods are mapped to their `label_vim_id` by
+    the pushed `kube_pod_labels` series or, if it is given, by the PodLabelsIndex.
+
+    The values of the pods updated by each request are published at once, along with their
+    derived metrics. The series and the pod labels that are not updated for `staleness`
+    seconds are dropped by `sweep()`, so the vanished pods do not pile up.
+
+    Attributes:
+        producer (object): The kafka_client.producer.Producer object
+        metrics (dict): The metrics to be published (entries of the metric registry) by name
+        encoder (object): The kafka_client.serializers.MetricPayloadEncoder object
+        derived_metrics (list): The derived metrics as defined in the `DERIVED_METRICS_LIST`
+        pod_labels (object, optional): The PodLabelsIndex object
+        payload_mode (str): Either `metric` or `container` (see `KAFKA_PAYLOAD_MODE`)
+        staleness (int): The seconds after which a series that is not updated is dropped
+
+    Methods:
+        ingest(body): decode a remote_write request and publish its values
+        sweep(): drop the stale series and pod labels
+    """
+
+    def __init__(self, producer, metrics, encoder, derived_metrics=(), pod_labels=None,
+                 payload_mode="metric", staleness=300, schema_version=2):
+        """Class Constructor."""
+        self.producer = producer
+        self.metrics = {metric['name']: metric for metric in metrics}
+        self.encoder = encoder
+        self.derived_metrics = list(derived_metrics)
+        self.pod_labels = pod_labels
+        self.payload_mode = payload_mode
+        self.staleness = staleness
+        self.schema_version = schema_version
+        self.__lock = threading.Lock()
+        # The (vim_id, ow_action) per pod, by the pushed `kube_pod_labels`, and the timestamp
+        # (ms) of their latest update
+        self.__pods = {}
+        self.__pods_updated = {}
+        # The latest (timestamp in ms, raw value, per pod value) per series, per (metric, pod)
+        self.__series = {}
+        self.__derived_inputs = set()
+        for definition in self.derived_metrics:
+            self.__derived_inputs.update((definition['numerator'], definition['denominator']))
+
+    def ingest(self, body):
+        """ Decode a (snappy compressed) remote_write request and publish its values
+
+        Args:
+            body (bytes): The body of the request
+
+        Returns:
+            int: the number of the published values
+
+        Raises:
+            ValueError: if the request is corrupted
+        """
+        series = decode_write_request(snappy_decompress(body))
+        # The state is updated under the lock; the messages are published after it is
+        # released, so a blocked producer does not serialize the concurrent requests
+        with self.__lock:
+            updated = set()
+            for labels, samples in series:
+                metric_name = labels.get("__name__")
+                if metric_name == POD_LABELS_METRIC:
+                    self.__update_pod_labels(labels, samples)
+                elif metric_name in self.metrics or metric_name in self.__derived_inputs:
+                    pod = self.__update_series(metric_name, labels, samples)
+                    if pod is not None:
+                        updated.add((metric_name, pod))
+            container_samples = self.__collect(updated)
+        return self.__publish(container_samples)
+
+    def sweep(self):
+        """ Drop the series and the pod labels that were not updated for `staleness` seconds,
+        e.g. the ones of the pods that no longer exist
+
+        Returns:
+            int: the number of the dropped series and pods
+        """
+        expired_ms = time.time() * 1000 - self.staleness * 1000
+        dropped = 0
+        with self.__lock:
+            for series_key in list(self.__series):
+                pod_series = self.__series[series_key]
+                for key in [key for key, (timestamp, _, _) in pod_series.items()
+                            if timestamp < expired_ms]:
+                    del pod_series[key]
+                    dropped += 1
+                if not pod_series:
+                    del self.__series[series_key]
+            for pod in [pod for pod, timestamp in self.__pods_updated.items()
+                        if timestamp < expired_ms]:
+                del self.__pods[pod]
+                del self.__pods_updated[pod]
+                dropped += 1
+        return dropped
+
+    def __update_pod_labels(self, labels, samples):
+        """ Keep the pod labels of a pushed `kube_pod_labels` series """
+        if labels.get("pod") and labels.get("label_vim_id") and labels.get("label_ow_action"):
+            self.__pods[labels['pod']] = (labels['label_vim_id'], labels['label_ow_action'])
+            self.__pods_updated[labels['pod']] = max(
+                [timestamp for timestamp, _ in samples] or [time.time() * 1000])
+
+    def __update_series(self, metric_name, labels, samples):
+        """ Keep the latest sample of a series and compute its per pod value
+
+        Returns:
+            str: the pod of the series or None if the series is skipped
+        """
+        pod = labels.get("pod_name") or labels.get("pod")
+        if not pod or labels.get("namespace") != NAMESPACE or not samples:
+            return None
+        SERIES_PARSED.labels(metric_name).inc()
+        key = tuple(sorted(labels.items()))
+        pod_series = self.__series.setdefault((metric_name, pod), {})
+        previous = pod_series.get(key)
+        is_rate = self.__get_function(metric_name) == "rate"
+        for timestamp, value in sorted(samples):
+            if previous is not None and timestamp <= previous[0]:
+                continue
+            pod_value = value
+            if is_rate:
+                if previous is None:
+                    # The rate needs two samples
+                    previous = (timestamp, value, None)
+                    continue
+                delta = value - previous[1]
+                if delta < 0:
+                    # A counter reset
+                    delta = value
+                pod_value = delta / ((timestamp - previous[0]) / 1000.0)
+            previous = (timestamp, value, pod_value)
+        if previous is None:
+            return None
+        pod_series[key] = previous
+        return pod if previous[2] is not None else None
+
+    def __get_function(self, metric_name):
+        metric = self.metrics.get(metric_name)
+        if metric is not None:
+            return metric['function']
+        return get_metric_function(metric_name)
+
+    def __get_pod_value(self, metric_name, pod, now_ms):
+        """ Get the sum of the latest values of the fresh series of a pod
+
+        Returns:
+            tuple: the timestamp (ms) and the value or None if there are no fresh series
+        """
+        pod_series = self.__series.get((metric_name, pod), {})
+        for key in [key for key, (timestamp, _, _) in pod_series.items()
+                    if now_ms - timestamp > self.staleness * 1000]:
+            del pod_series[key]
+        values = [(timestamp, pod_value) for timestamp, _, pod_value in pod_series.values()
+                  if pod_value is not None]
+        if not values:
+            return None
+        return max(timestamp for timestamp, _ in values), sum(value for _, value in values)
+
+    def __get_container(self, pod):
+        """ Get the container ID (`label_vim_id`) of a pod or None if it is not relevant """
+        labels = self.__pods.get(pod)
+        if labels is None and self.pod_labels is not None:
+            labels = self.pod_labels.lookup(pod)
+        if labels is None or not owns_container(labels[0]):
+            return None
+        return labels[0]
+
+    def __collect(self, updated):
+        """ Get the per pod values of the updated (metric, pod) pairs and their derived metrics
+
+        Returns:
+            dict: the (metric name, timestamp, value) samples per container ID
+        """
+        now_ms = time.time() * 1000
+        derived_stage = DerivedMetricsStage(self.derived_metrics)
+        container_samples = {}
+        updated_pods = set()
+        for metric_name, pod in updated:
+            container = self.__get_container(pod)
+            if container is None:
+                continue
+            updated_pods.add((pod, container))
+            if metric_name not in self.metrics:
+                continue
+            pod_value = self.__get_pod_value(metric_name, pod, now_ms)
+            if pod_value is None:
+                continue
+            timestamp = convert_unix_timestamp_to_datetime_str(pod_value[0] / 1000.0)
+            value = format_sample_value(pod_value[1])
+            container_samples.setdefault(container, []).append((metric_name, timestamp, value))
+
+        # The derived metrics of the updated pods, from the latest values of their inputs
+        for pod, container in updated_pods:
+            for metric_name in self.__derived_inputs:
+                pod_value = self.__get_pod_value(metric_name, pod, now_ms)
+                if pod_value is not None:
+                    timestamp = convert_unix_timestamp_to_datetime_str(pod_value[0] / 1000.0)
+                    derived_stage.add(container, metric_name, timestamp, pod_value[1])
+        for container, definition, timestamp, value in derived_stage.compute():
+            container_samples.setdefault(container, []).append(
+                (definition['name'], timestamp, value))
+        return container_samples
+
+    def __publish(self, container_samples):
+        """ Publish the samples per container ID
+
+        Returns:
+            int: the number of the published values
+        """
+        published = 0
+        for container, samples in container_samples.items():
+            if self.payload_mode == "container":
+                self.producer.publish(self.encoder.encode_container(
+                    container, [self.encoder.encode_sample(*sample) for sample in samples],
+                    self.schema_version), get_message_key(container))
+            else:
+                for metric_name, timestamp, value in samples:
+                    self.producer.publish(self.encoder.encode(container, metric_name,
+                                                              [(timestamp, value)]),
+                                          get_message_key(container, metric_name))
+            published += len(samples)
+        return published
+
+
+class RemoteWriteHandler(BaseHTTPRequestHandler):
+    """ Receive the remote_write requests of Prometheus """
+
+    def do_POST(self):
+        if self.path.split("?", 1)[0] != WRITE_PATH:
+            self.send_error(404)
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            self.server.ingester.ingest(body)
+        except ValueError as ex:
+            # A corrupted request is not retried by Prometheus (4xx)
+            error_logger.error("Invalid remote_write request: {}".format(ex))
+            REMOTE_WRITE_REQUESTS.labels("invalid").inc()
+            self.send_error(400, str(ex))
+            return
+        except Exception as ex:
+            error_logger.exception(ex)
+            REMOTE_WRITE_REQUESTS.labels("failed").inc()
+            self.send_error(500)
+            return
+        REMOTE_WRITE_REQUESTS.labels("ok").inc()
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug("Remote write: " + format % args)
+
+
+class RemoteWriteServer(ThreadingMixIn, HTTPServer):
+    """RemoteWriteServer Class.
+
+    An HTTP server that handles each remote_write request in a thread.
+
+    Attributes:
+        ingester (object): The RemoteWriteIngester object
+    """
+    daemon_threads = True
+
+    def __init__(self, port, ingester, address=""):
+        """Class Constructor."""
+        super(RemoteWriteServer, self).__init__((address, port), RemoteWriteHandler)
+        self.ingester = ingester
+
+
+def run_forever(server, producer, interval, flush_timeout=None, replay_max_messages=0,
+                prom_ql=None):
+    """ Serve the remote_write requests and, every `interval` seconds, drop the stale series
+    and flush the kafka producer
+
+    Args:
+        server (object): The RemoteWriteServer object
+        producer (object): The kafka_client.producer.Producer object
+        interval (int): The seconds between two flushes
+        flush_timeout (int, optional): Max seconds to wait for the in-flight messages
+        replay_max_messages (int): The max number of spooled messages replayed per flush
+        prom_ql (object, optional): The Query or QueryRange object that refreshes the
+            PodLabelsIndex of the ingester (if any)
+
+    Returns:
+        None
+    """
+    thread = threading.Thread(target=server.serve_forever, name="remote-write", daemon=True)
+    thread.start()
+    logger.info("Receiving the remote_write requests on port {}".format(server.server_address[1]))
+    pod_labels = server.ingester.pod_labels
+    try:
+        while True:
+            time.sleep(interval)
+            if pod_labels is not None and prom_ql is not None:
+                try:
+                    pod_labels.refresh(prom_ql)
+                except Exception as ex:
+                    error_logger.exception(ex)
+            dropped = server.ingester.sweep()
+            if dropped:
+                logger.debug("Dropped {} stale series and pods".format(dropped))
+            producer.replay(replay_max_messages)
+            counters = producer.flush(timeout=flush_timeout)
+            logger.info("Kafka messages: {} acked, {} failed, {} spooled, {} replayed".format(
+                counters["acked"], counters["failed"], counters["spooled"], counters["replayed"]))
+            if producer.spool is not None:
+                SPOOL_BYTES.set(producer.spool.size())
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,124 @@
+"""
+A module that runs the collection cycles aligned to the wall-clock.
+"""
+
+import logging.config
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import CYCLE_DURATION, CYCLE_OVERRUNS, LAST_CYCLE_COMPLETED
+from settings import LOGGING
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+
+class AlignedScheduler(object):
+    """AlignedScheduler Class.
+
+    The cycles start at the multiples of the interval (e.g. :00, :20, :40 for 20 seconds), so
+    they do not drift. Each cycle runs in a worker thread and gets a fixed [start, end]
+    window. If the previous cycle is still running at a tick, the tick is reported as an
+    overrun and skipped; the next cycle covers the skipped window as well, so there are
+    neither gaps nor overlapping windows.
+
+    Attributes:
+        interval (int): The seconds between two consecutive ticks
+        job (function): The cycle; it is called as `job(window=(start, end))`
+        overruns (int): The number of ticks skipped because of a slow cycle
+
+    Methods:
+        run_forever(): run the cycles until the process is stopped
+        tick(now): dispatch the cycle of the given tick
+    """
+
+    def __init__(self, interval, job):
+        """Class Constructor."""
+        self.interval = interval
+        self.job = job
+        self.overruns = 0
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__future = None
+        self.__window_start = None
+
+    def next_tick(self, now):
+        """ Get the next wall-clock boundary after the given time
+
+        Args:
+            now (float): The current unix timestamp
+
+        Returns:
+            float: the unix timestamp of the next tick
+        """
+        return (math.floor(now / self.interval) + 1) * self.interval
+
+    def tick(self, now):
+        """ Dispatch the cycle of the tick at the given time, unless the previous one is running
+
+        Args:
+            now (float): The unix timestamp of the tick
+
+        Returns:
+            bool: True if the cycle was dispatched. False otherwise.
+        """
+        if self.__future is not None and not self.__future.done():
+            self.overruns += 1
+            CYCLE_OVERRUNS.inc()
+            error_logger.warning("Overrun: the previous cycle is still running at {}; skip the "
+                                 "tick ({} overruns so far)".format(now, self.overruns))
+            return False
+
+        window_start = self.__window_start if self.__window_start is not None else \
+            now - self.interval
+        window = (window_start, now)
+        self.__window_start = now
+        self.__future = self.__executor.submit(self._run, window)
+        return True
+
+    def run_forever(self):
+        """ Run the cycles until the process is stopped
+
+        Returns:
+            None
+        """
+        tick_at = self.next_tick(time.time())
+        try:
+            while True:
+                time.sleep(max(0.0, tick_at - time.time()))
+                self.tick(tick_at)
+
+                tick_at += self.interval
+                now = time.time()
+                if tick_at <= now:
+                    # The process was suspended; the missed ticks are covered by the next one
+                    error_logger.warning("Missed {} ticks".format(
+                        int((now - tick_at) // self.interval) + 1))
+                    tick_at = self.next_tick(now)
+        finally:
+            self.__executor.shutdown(wait=True)
+
+    def _run(self, window):
+        """ Run a cycle and report its duration
+
+        Args:
+            window (tuple): The start and the end unix timestamps of the cycle
+
+        Returns:
+            None
+        """
+        started_at = time.time()
+        try:
+            self.job(window=window)
+        except Exception as ex:
+            error_logger.exception(ex)
+        completed_at = time.time()
+        duration = completed_at - started_at
+        CYCLE_DURATION.observe(duration)
+        LAST_CYCLE_COMPLETED.set(completed_at)
+        logger.info("Cycle [{}, {}] completed in {:.3f} secs".format(window[0], window[1],
+                                                                    duration))
+        if duration > self.interval:
+            error_logger.warning("Overrun: the cycle [{}, {}] took {:.3f} secs, longer than the "
+                                 "interval of {} secs".format(window[0], window[1], duration,
+                                                              self.interval))
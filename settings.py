@@ -3,6 +3,7 @@ Definition of the settings
 """
 
 import os
+import socket
 
 DEBUG = int(os.environ.get("DEBUG", 0))
 PROJECT_ROOT = os.path.dirname(os.path.realpath(__file__))
@@ -15,6 +16,36 @@ KAFKA_SERVER = "{}:{}".format(os.environ.get("KAFKA_IP", "192.168.1.175"),
 KAFKA_CLIENT_ID = 'kubernetes-prometheus-publisher'
 KAFKA_API_VERSION = (1, 1, 0)
 KAFKA_KUBERNETES_TOPIC = os.environ.get("KAFKA_KUBERNETES_TOPIC", "nfvi.ncsrd.kubernetes")
+# The batching and the compression of the producer (see the KafkaProducer documentation). The
+# `lz4` and `snappy` compression types require the relevant optional packages.
+KAFKA_COMPRESSION_TYPE = os.environ.get("KAFKA_COMPRESSION_TYPE", "none")
+KAFKA_BATCH_SIZE = int(os.environ.get("KAFKA_BATCH_SIZE", 16384))  # bytes
+KAFKA_LINGER_MS = int(os.environ.get("KAFKA_LINGER_MS", 0))
+KAFKA_BUFFER_MEMORY = int(os.environ.get("KAFKA_BUFFER_MEMORY", 33554432))  # bytes
+KAFKA_ACKS = os.environ.get("KAFKA_ACKS", "1")  # 0, 1 or all
+# The max milliseconds that a send waits for the metadata or for buffer memory; it also bounds
+# the check of the broker when the producer is created
+KAFKA_MAX_BLOCK_MS = int(os.environ.get("KAFKA_MAX_BLOCK_MS", 5000))
+# The key of the messages: `container_id` (all the messages of a container in the same
+# partition, in order), `container_metric` (per container and metric) or `none`; the
+# partitioner is either `default` (murmur2, as the Java client) or `crc32`
+KAFKA_KEY_STRATEGY = os.environ.get("KAFKA_KEY_STRATEGY", "container_id")
+KAFKA_PARTITIONER = os.environ.get("KAFKA_PARTITIONER", "default")
+# If KAFKA_SPOOL_DIR is set, the messages that are not published are kept in segment files in
+# it (up to KAFKA_SPOOL_MAX_BYTES, evicting the oldest ones) and up to
+# KAFKA_SPOOL_REPLAY_MAX_MESSAGES of them are replayed per cycle once the broker recovers
+KAFKA_SPOOL_DIR = os.environ.get("KAFKA_SPOOL_DIR", "")
+KAFKA_SPOOL_SEGMENT_BYTES = int(os.environ.get("KAFKA_SPOOL_SEGMENT_BYTES", 8 * 1024 * 1024))
+KAFKA_SPOOL_MAX_BYTES = int(os.environ.get("KAFKA_SPOOL_MAX_BYTES", 512 * 1024 * 1024))
+KAFKA_SPOOL_REPLAY_MAX_MESSAGES = int(os.environ.get("KAFKA_SPOOL_REPLAY_MAX_MESSAGES", 5000))
+# Either `metric` (a message per metric and container) or `container` (a single message that
+# groups all the metrics of a container per cycle; see README)
+KAFKA_PAYLOAD_MODE = os.environ.get("KAFKA_PAYLOAD_MODE", "metric")
+# The JSON library used to serialize the messages: `auto` (orjson or ujson if they are
+# installed, otherwise json), `orjson`, `ujson` or `json`
+KAFKA_JSON_BACKEND = os.environ.get("KAFKA_JSON_BACKEND", "auto")
+# Max seconds to wait for the in-flight messages at the end of each cycle
+KAFKA_FLUSH_TIMEOUT = int(os.environ.get("KAFKA_FLUSH_TIMEOUT", 30))
 
 # =================================
 # PROMETHEUS SETTINGS
@@ -22,6 +53,25 @@ KAFKA_KUBERNETES_TOPIC = os.environ.get("KAFKA_KUBERNETES_TOPIC", "nfvi.ncsrd.ku
 PROMETHEUS = {"HOST": os.environ.get("PROMETHEUS_HOST", "10.100.176.57"),
               "PORT": os.environ.get("PROMETHEUS_PORT", 31078)}
 PROMETHEUS_POLLING_STEP = os.environ.get("PROMETHEUS_POLLING_STEP", '20s')
+# Either `range` (query_range API) or `instant` (query API: evaluate only the latest timestamp)
+PROMETHEUS_QUERY_MODE = os.environ.get("PROMETHEUS_QUERY_MODE", "range")
+# Parse the Prometheus responses incrementally (series by series) instead of loading them at once
+PROMETHEUS_STREAM_RESPONSES = int(os.environ.get("PROMETHEUS_STREAM_RESPONSES", 0))
+# Max number of `query_range` requests that are in-flight at the same time. Use 1 to
+# fetch the metrics sequentially.
+PROMETHEUS_MAX_CONCURRENT_QUERIES = int(os.environ.get("PROMETHEUS_MAX_CONCURRENT_QUERIES", 8))
+# Max number of metrics that are fetched in a single (batched) query. Use 1 to fetch each
+# metric through its own query.
+PROMETHEUS_QUERY_BATCH_SIZE = int(os.environ.get("PROMETHEUS_QUERY_BATCH_SIZE", 1))
+# Seconds to cache the pod -> (label_vim_id, label_ow_action) mapping; the metrics are then
+# queried per pod without the `kube_pod_labels` join. Use 0 to join them in Prometheus.
+PROMETHEUS_POD_LABELS_TTL = int(os.environ.get("PROMETHEUS_POD_LABELS_TTL", 0))
+# The HTTP connections to the Prometheus API are pooled and kept alive across the cycles
+PROMETHEUS_HTTP_POOL_SIZE = int(os.environ.get("PROMETHEUS_HTTP_POOL_SIZE",
+                                               PROMETHEUS_MAX_CONCURRENT_QUERIES))
+PROMETHEUS_HTTP_MAX_RETRIES = int(os.environ.get("PROMETHEUS_HTTP_MAX_RETRIES", 2))
+PROMETHEUS_HTTP_BACKOFF_FACTOR = float(os.environ.get("PROMETHEUS_HTTP_BACKOFF_FACTOR", 0.5))
+PROMETHEUS_HTTP_TIMEOUT = float(os.environ.get("PROMETHEUS_HTTP_TIMEOUT", 15))  # seconds
 PROMETHEUS_METRICS_LIST = [
     {"name": "container_fs_inodes_free", "type": "gauge", "unit": ""},
     {"name": "container_fs_io_current", "type": "gauge", "unit": "iops"},
@@ -47,10 +97,117 @@ PROMETHEUS_METRICS_LIST = [
     {"name": "container_network_tcp_usage_total", "type": "gauge", "unit": ""},
     {"name": "container_network_udp_usage_total", "type": "gauge", "unit": ""},
     {"name": "container_spec_memory_reservation_limit_bytes", "type": "gauge", "unit": "bytes"},
-    {"name": "container_network_receive_packet_loss_percentage", "type": "counter", "unit": "%"},
-    {"name": "container_network_transmit_packet_loss_percentage", "type": "counter", "unit": "%"}
+    # The derived metrics are evaluated in Prometheus by their PromQL `expression`, where each
+    # `{<metric>}` is replaced by the per pod expression of the metric (see the
+    # DERIVED_METRICS_MODE). A zero denominator gives 0.
+    {"name": "container_network_receive_packet_loss_percentage", "type": "counter", "unit": "%",
+     "expression": "100 * {container_network_receive_packets_dropped_total}"
+                   " / ({container_network_receive_packets_total} > 0)"
+                   " or {container_network_receive_packets_total} * 0"},
+    {"name": "container_network_transmit_packet_loss_percentage", "type": "counter", "unit": "%",
+     "expression": "100 * {container_network_transmit_packets_dropped_total}"
+                   " / ({container_network_transmit_packets_total} > 0)"
+                   " or {container_network_transmit_packets_total} * 0"}
 ]
 
+# Either `promql` to evaluate the metrics that have an `expression` in Prometheus or `client`
+# to compute them in the publisher from their inputs (see the DERIVED_METRICS_LIST)
+DERIVED_METRICS_MODE = os.environ.get("DERIVED_METRICS_MODE", "promql")
+
+# The metrics that are derived from the collected ones as `scale * numerator / denominator`
+# per container, instead of being queried. The optional ones are enabled by name through the
+# DERIVED_METRICS_EXTRA (comma separated).
+DERIVED_METRICS_LIST = [
+    {"name": "container_network_receive_packet_loss_percentage", "type": "counter", "unit": "%",
+     "numerator": "container_network_receive_packets_dropped_total",
+     "denominator": "container_network_receive_packets_total", "scale": 100},
+    {"name": "container_network_transmit_packet_loss_percentage", "type": "counter", "unit": "%",
+     "numerator": "container_network_transmit_packets_dropped_total",
+     "denominator": "container_network_transmit_packets_total", "scale": 100},
+]
+OPTIONAL_DERIVED_METRICS_LIST = [
+    {"name": "container_network_receive_errors_percentage", "type": "gauge", "unit": "%",
+     "numerator": "container_network_receive_errors_total",
+     "denominator": "container_network_receive_packets_total", "scale": 100},
+    {"name": "container_network_transmit_errors_percentage", "type": "gauge", "unit": "%",
+     "numerator": "container_network_transmit_errors_total",
+     "denominator": "container_network_transmit_packets_total", "scale": 100},
+    {"name": "container_cpu_cfs_throttled_ratio", "type": "gauge", "unit": "",
+     "numerator": "container_cpu_cfs_throttled_seconds_total",
+     "denominator": "container_cpu_usage_seconds_total", "scale": 1},
+]
+DERIVED_METRICS_EXTRA = [name.strip() for name in
+                         os.environ.get("DERIVED_METRICS_EXTRA", "").split(",") if name.strip()]
+DERIVED_METRICS_LIST += [metric for metric in OPTIONAL_DERIVED_METRICS_LIST
+                         if metric['name'] in DERIVED_METRICS_EXTRA]
+if DERIVED_METRICS_MODE == "promql":
+    DERIVED_METRICS_LIST = [metric for metric in DERIVED_METRICS_LIST
+                            if metric['name'] not in {m['name'] for m in PROMETHEUS_METRICS_LIST
+                                                      if "expression" in m}]
+
+# =================================
+# WATERMARKS SETTINGS
+# =================================
+# Keep the timestamp of the latest published value per metric and container, so each cycle
+# queries only the new values and publishes all of them (backfilling after outages, up to
+# WATERMARKS_MAX_BACKFILL_SECONDS). If WATERMARKS_FILE is set, they survive the restarts.
+WATERMARKS_ENABLED = int(os.environ.get("WATERMARKS_ENABLED", 0))
+WATERMARKS_FILE = os.environ.get("WATERMARKS_FILE", "")
+WATERMARKS_MAX_BACKFILL_SECONDS = int(os.environ.get("WATERMARKS_MAX_BACKFILL_SECONDS", 3600))
+
+# =================================
+# SHARDING SETTINGS
+# =================================
+# Many replicas split the load if each one has a distinct SHARD_INDEX in [0, SHARD_COUNT). Use
+# SHARD_INDEX=auto to take it from the ordinal suffix of the hostname (e.g. a StatefulSet pod);
+# the HOSTNAME variable is not available to the processes started by supervisor.
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 1))
+SHARD_INDEX = os.environ.get("SHARD_INDEX", "0")
+if SHARD_INDEX == "auto":
+    SHARD_INDEX = socket.gethostname().rsplit("-", 1)[-1]
+SHARD_INDEX = int(SHARD_INDEX)
+# Either `metric` (each replica owns a subset of the metrics) or `container` (each replica owns
+# a subset of the containers, by hash of their `label_vim_id`). With `container`, every replica
+# still runs all the queries; only the kafka messages are split.
+SHARD_STRATEGY = os.environ.get("SHARD_STRATEGY", "metric")
+
+# =================================
+# INGESTION SETTINGS
+# =================================
+# Either `poll` to query the Prometheus API every SCHEDULER_SECONDS or `remote_write` to
+# receive the samples pushed by Prometheus on REMOTE_WRITE_PORT (`/api/v1/write`)
+INGESTION_MODE = os.environ.get("INGESTION_MODE", "poll")
+REMOTE_WRITE_PORT = int(os.environ.get("REMOTE_WRITE_PORT", 9201))
+# The seconds after which a pushed series that is not updated is dropped
+REMOTE_WRITE_STALENESS_SECONDS = int(os.environ.get("REMOTE_WRITE_STALENESS_SECONDS", 300))
+
+# =================================
+# STATE SETTINGS
+# =================================
+# Where the watermarks and the published values (suppression) are kept: `memory` or `redis`.
+# With Redis, they are shared among the replicas of the same shard and survive the restarts;
+# if STATE_LEADER_LOCK is set, only one of these replicas (the leader) runs each cycle.
+STATE_BACKEND = os.environ.get("STATE_BACKEND", "memory")
+STATE_REDIS_URL = os.environ.get("STATE_REDIS_URL", "redis://localhost:6379/0")
+STATE_KEY_PREFIX = os.environ.get("STATE_KEY_PREFIX", "k8s-prometheus-publisher")
+STATE_LEADER_LOCK = int(os.environ.get("STATE_LEADER_LOCK", 0))
+
+# =================================
+# SUPPRESSION SETTINGS
+# =================================
+# Publish a series only if its latest value changed by more than the relative threshold
+# (e.g. 0.01 for 1%) or if it was not published for the heartbeat cycles
+SUPPRESSION_ENABLED = int(os.environ.get("SUPPRESSION_ENABLED", 0))
+SUPPRESSION_THRESHOLD = float(os.environ.get("SUPPRESSION_THRESHOLD", 0.0))
+SUPPRESSION_HEARTBEAT_CYCLES = int(os.environ.get("SUPPRESSION_HEARTBEAT_CYCLES", 10))
+
+# =================================
+# INSTRUMENTATION SETTINGS
+# =================================
+# The port of the HTTP endpoint that serves the metrics of the publisher itself (`/metrics`);
+# 0 disables it
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9108))
+
 # =================================
 # SCHEDULER SETTINGS
 # =================================
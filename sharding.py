@@ -0,0 +1,106 @@
+"""
+A module that splits the collected metrics or containers among many publisher replicas.
+"""
+
+import zlib
+from settings import SHARD_INDEX, SHARD_COUNT, SHARD_STRATEGY, DERIVED_METRICS_LIST
+
+# The inputs and the outputs of the derived metrics (e.g. packet loss) are owned by the same
+# shard
+DERIVED_METRICS = set()
+for derived_metric in DERIVED_METRICS_LIST:
+    DERIVED_METRICS.update((derived_metric['name'], derived_metric['numerator'],
+                            derived_metric['denominator']))
+
+
+def validate_shard(shard_index=SHARD_INDEX, shard_count=SHARD_COUNT, strategy=SHARD_STRATEGY):
+    """ Check the sharding settings, so a misconfigured replica does not publish the data of
+    another one
+
+    Args:
+        shard_index (int): The index of the shard
+        shard_count (int): The number of shards
+        strategy (str): Either `metric` or `container`
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: if the index is not in [0, shard_count) or the strategy is unknown
+    """
+    if shard_count < 1:
+        raise ValueError("Invalid shard count `{}`".format(shard_count))
+    if not 0 <= shard_index < shard_count:
+        raise ValueError("The shard index `{}` is not in [0, {})".format(shard_index,
+                                                                         shard_count))
+    if strategy not in ("metric", "container"):
+        raise ValueError("Invalid shard strategy `{}`".format(strategy))
+
+
+def get_shard(key, shard_count=SHARD_COUNT):
+    """ Map the given key to a shard; the mapping is the same in every replica
+
+    Args:
+        key (str): The key, e.g. a metric name or a container ID
+        shard_count (int): The number of shards
+
+    Returns:
+        int: the shard index in [0, shard_count)
+    """
+    return zlib.crc32(key.encode('utf-8')) % shard_count
+
+
+def get_metric_shard_key(metric_name):
+    """ Get the key that assigns the given metric to a shard
+
+    Args:
+        metric_name (str): The name of the metric
+
+    Returns:
+        str: the shard key
+    """
+    if metric_name in DERIVED_METRICS:
+        return "derived"
+    return metric_name
+
+
+def filter_metrics(metrics, shard_index=SHARD_INDEX, shard_count=SHARD_COUNT,
+                   strategy=SHARD_STRATEGY):
+    """ Keep the metrics that are owned by the given shard
+
+    Args:
+        metrics (list): The metrics as defined in the `PROMETHEUS_METRICS_LIST`
+        shard_index (int): The index of the shard
+        shard_count (int): The number of shards
+        strategy (str): Either `metric` or `container`
+
+    Returns:
+        list: the owned metrics; all of them unless the metrics are sharded
+    """
+    if strategy != "metric" or shard_count <= 1:
+        return list(metrics)
+    return [metric for metric in metrics
+            if get_shard(get_metric_shard_key(metric['name']), shard_count) == shard_index]
+
+
+def owns_container(container_id, shard_index=SHARD_INDEX, shard_count=SHARD_COUNT,
+                   strategy=SHARD_STRATEGY):
+    """ Check if the given container is owned by the given shard
+
+    Args:
+        container_id (str): The container ID, i.e. the `label_vim_id`
+        shard_index (int): The index of the shard
+        shard_count (int): The number of shards
+        strategy (str): Either `metric` or `container`
+
+    Returns:
+        bool: True if the container is owned by the shard; always True unless the containers
+            are sharded
+    """
+    if strategy != "container" or shard_count <= 1:
+        return True
+    return get_shard(container_id, shard_count) == shard_index
+
+
+# Fail at startup if the sharding settings are invalid
+validate_shard()
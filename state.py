@@ -0,0 +1,209 @@
+"""
+A module that keeps the state of the publisher (watermarks, published values, leader lock)
+either in memory or in Redis, so it is shared among the replicas and survives the restarts.
+"""
+
+import logging.config
+import threading
+import time
+from settings import LOGGING
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+
+class MemoryStateBackend(object):
+    """MemoryStateBackend Class.
+
+    It keeps the state in the process memory; it is the fallback of a single replica. The
+    lock is always granted unless it is held.
+
+    Methods:
+        get_all(name): get all the fields of a table
+        update(name, mapping, deleted): set and delete fields of a table
+        acquire_lock(name, ttl): acquire a lock that expires after `ttl` milliseconds
+    """
+
+    def __init__(self):
+        """Class Constructor."""
+        self.__tables = {}
+        self.__locks = {}
+        self.__lock = threading.Lock()
+
+    def get_all(self, name):
+        """ Get all the fields of a table
+
+        Args:
+            name (str): The name of the table
+
+        Returns:
+            dict: the values (str) per field (str)
+        """
+        with self.__lock:
+            return dict(self.__tables.get(name, {}))
+
+    def update(self, name, mapping, deleted=()):
+        """ Set and delete fields of a table in a single step
+
+        Args:
+            name (str): The name of the table
+            mapping (dict): The values (str) per field (str) to be set
+            deleted (iterable): The fields to be deleted
+
+        Returns:
+            None
+        """
+        with self.__lock:
+            table = self.__tables.setdefault(name, {})
+            table.update(mapping)
+            for field in deleted:
+                table.pop(field, None)
+
+    def acquire_lock(self, name, ttl):
+        """ Acquire a lock, unless it is held
+
+        Args:
+            name (str): The name of the lock
+            ttl (int): The milliseconds after which the lock expires
+
+        Returns:
+            bool: True if the lock was acquired. False otherwise.
+        """
+        now = time.time()
+        with self.__lock:
+            if self.__locks.get(name, 0) > now:
+                return False
+            self.__locks[name] = now + ttl / 1000.0
+            return True
+
+
+class RedisStateBackend(object):
+    """RedisStateBackend Class.
+
+    It keeps each table in a Redis hash; the reads and the writes of a table are done in a
+    single round trip (pipelined). The lock is a `SET NX PX` key, so only one replica gets it
+    and it is released on expiry, even if the replica dies.
+
+    Attributes:
+        prefix (str): The prefix of the Redis keys
+
+    Methods:
+        get_all(name): get all the fields of a table
+        update(name, mapping, deleted): set and delete fields of a table
+        acquire_lock(name, ttl): acquire a lock that expires after `ttl` milliseconds
+    """
+
+    def __init__(self, url, prefix="k8s-prometheus-publisher"):
+        """Class Constructor.
+
+        Args:
+            url (str): The Redis URL, e.g. `redis://localhost:6379/0`
+            prefix (str): The prefix of the Redis keys
+
+        Raises:
+            RuntimeError: if the redis package is not installed
+        """
+        if redis is None:
+            raise RuntimeError("The `redis` package is required by the Redis state backend")
+        self.prefix = prefix
+        self.__client = redis.Redis.from_url(url, decode_responses=True)
+
+    def get_all(self, name):
+        """ Get all the fields of a table
+
+        Args:
+            name (str): The name of the table
+
+        Returns:
+            dict: the values (str) per field (str)
+        """
+        return self.__client.hgetall(self.__key(name))
+
+    def update(self, name, mapping, deleted=()):
+        """ Set and delete fields of a table in a single, pipelined transaction
+
+        Args:
+            name (str): The name of the table
+            mapping (dict): The values (str) per field (str) to be set
+            deleted (iterable): The fields to be deleted
+
+        Returns:
+            None
+        """
+        deleted = list(deleted)
+        if not mapping and not deleted:
+            return
+        pipeline = self.__client.pipeline(transaction=True)
+        if mapping:
+            pipeline.hmset(self.__key(name), mapping)
+        if deleted:
+            pipeline.hdel(self.__key(name), *deleted)
+        pipeline.execute()
+
+    def acquire_lock(self, name, ttl):
+        """ Acquire a lock, unless another replica holds it
+
+        Args:
+            name (str): The name of the lock
+            ttl (int): The milliseconds after which the lock expires
+
+        Returns:
+            bool: True if the lock was acquired. False otherwise.
+        """
+        return bool(self.__client.set(self.__key("lock:" + name), "1", nx=True, px=ttl))
+
+    def __key(self, name):
+        return "{}:{}".format(self.prefix, name)
+
+
+def get_state_backend(backend, url=None, prefix="k8s-prometheus-publisher"):
+    """ Create the state backend by its name
+
+    Args:
+        backend (str): Either `memory` or `redis`
+        url (str, optional): The Redis URL
+        prefix (str): The prefix of the Redis keys
+
+    Returns:
+        object: the MemoryStateBackend or the RedisStateBackend object
+
+    Raises:
+        ValueError: if the backend is unknown
+    """
+    if backend == "memory":
+        return MemoryStateBackend()
+    if backend == "redis":
+        return RedisStateBackend(url, prefix)
+    raise ValueError("Unknown state backend `{}`".format(backend))
+
+
+def encode_field(metric_name, container_id):
+    """ Encode the field of a (metric, container) in a state table
+
+    Args:
+        metric_name (str): The name of the metric
+        container_id (str): The container ID
+
+    Returns:
+        str: the field
+    """
+    return "{}|{}".format(metric_name, container_id)
+
+
+def decode_field(field):
+    """ Decode the field of a (metric, container) in a state table
+
+    Args:
+        field (str): The field
+
+    Returns:
+        tuple: the metric name and the container ID
+    """
+    metric_name, _, container_id = field.partition("|")
+    return metric_name, container_id
@@ -0,0 +1,192 @@
+"""
+A module that suppresses the messages of the values that have not changed.
+"""
+
+import logging.config
+import math
+from settings import LOGGING
+from state import encode_field, decode_field
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+
+class DeltaSuppressor(object):
+    """DeltaSuppressor Class.
+
+    It keeps the latest published value per (metric, container) and a value is published
+    only if it differs from it by more than the relative `threshold`, or if it has not been
+    published for `heartbeat_cycles` cycles, so the consumers still see the stable series.
+
+    The decisions of a cycle are staged and become effective through `commit()`, once the
+    messages are delivered; `rollback()` discards them, so the values are re-published in the
+    next cycle. The containers that are missing from a fully fetched metric are evicted on
+    commit.
+
+    If a state backend is given, the published values are kept in its `published` table,
+    so they are shared among the replicas and a restarted replica does not re-send them.
+
+    Attributes:
+        threshold (float): The min relative change, e.g. 0.01 for 1%, of a published value;
+            0 publishes every change
+        heartbeat_cycles (int): The max cycles between two messages of the same series; 0
+            disables the heartbeats
+        suppressed (int): The number of the values suppressed in the current cycle
+        backend (object, optional): The MemoryStateBackend or RedisStateBackend object
+
+    Methods:
+        start_cycle(cycle): set the index of the cycle and re-load the published values
+        mark_fetched(metric_name): stage that the metric was fetched in the cycle
+        mark_seen(metric_name, container_id): stage that a series was fetched in the cycle
+        should_publish(metric_name, container_id, value): decide if a value is published
+        commit(): apply the staged values and evict the vanished containers
+        rollback(): discard the staged values
+    """
+
+    def __init__(self, threshold=0.0, heartbeat_cycles=10, backend=None):
+        """Class Constructor."""
+        self.threshold = threshold
+        self.heartbeat_cycles = heartbeat_cycles
+        self.backend = backend
+        self.suppressed = 0
+        self.__cycle = 0
+        # The (value, cycle of the latest message) per container ID per metric name
+        self.__published = {}
+        self.__pending = {}
+        self.__seen = {}
+        self.__fetched = set()
+
+    def start_cycle(self, cycle):
+        """ Set the index of the cycle, e.g. the end of its window divided by the interval,
+        so the heartbeats are aligned among the replicas, and re-load the published values
+        from the state backend (if any)
+
+        Args:
+            cycle (int): The index of the cycle
+
+        Returns:
+            None
+        """
+        self.__cycle = cycle
+        if self.backend is None:
+            return
+        try:
+            table = self.backend.get_all("published")
+        except Exception as ex:
+            error_logger.error("Unable to load the published values from the state: {}".format(
+                ex))
+            return
+        published = {}
+        for field, entry in table.items():
+            metric_name, container_id = decode_field(field)
+            value, _, cycle = entry.partition("|")
+            published.setdefault(metric_name, {})[container_id] = (float(value), int(cycle))
+        self.__published = published
+
+    def mark_fetched(self, metric_name):
+        """ Stage that the response of the metric was fully parsed in the cycle, so its
+        containers that are missing from the response are evicted on `commit()`
+
+        Args:
+            metric_name (str): The name of the metric
+
+        Returns:
+            None
+        """
+        self.__fetched.add(metric_name)
+
+    def mark_seen(self, metric_name, container_id):
+        """ Stage that a series was fetched in the cycle, even without new values (e.g. with
+        the watermarks), so it is not evicted on `commit()`
+
+        Args:
+            metric_name (str): The name of the metric
+            container_id (str): The container ID
+
+        Returns:
+            None
+        """
+        self.__seen.setdefault(metric_name, set()).add(container_id)
+
+    def should_publish(self, metric_name, container_id, value):
+        """ Decide if the (latest) value of a series is published in this cycle
+
+        Args:
+            metric_name (str): The name of the metric
+            container_id (str): The container ID
+            value (str|float): The value
+
+        Returns:
+            bool: True if the value has to be published. False otherwise.
+        """
+        self.mark_seen(metric_name, container_id)
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            return True
+
+        previous = self.__published.get(metric_name, {}).get(container_id)
+        if previous is not None and not self.__changed(previous[0], value) and \
+                (not self.heartbeat_cycles or
+                 self.__cycle - previous[1] < self.heartbeat_cycles):
+            self.suppressed += 1
+            return False
+        self.__pending.setdefault(metric_name, {})[container_id] = (value, self.__cycle)
+        return True
+
+    def commit(self):
+        """ Apply the staged values, evict the containers that vanished from the fetched
+        metrics and start the next cycle
+
+        Returns:
+            None
+        """
+        for metric_name, values in self.__pending.items():
+            self.__published.setdefault(metric_name, {}).update(values)
+        evicted = []
+        for metric_name in self.__fetched:
+            container_ids = self.__seen.get(metric_name, set())
+            published = self.__published.get(metric_name)
+            if not published:
+                continue
+            for container_id in [c for c in published if c not in container_ids]:
+                del published[container_id]
+                evicted.append(encode_field(metric_name, container_id))
+        if evicted:
+            logger.debug("Evicted {} vanished series".format(len(evicted)))
+        if self.backend is not None:
+            changed = {encode_field(metric_name, container_id): "{!r}|{}".format(value, cycle)
+                       for metric_name, values in self.__pending.items()
+                       for container_id, (value, cycle) in values.items()}
+            try:
+                self.backend.update("published", changed, evicted)
+            except Exception as ex:
+                error_logger.error("Unable to save the published values in the state: {}".format(
+                    ex))
+        self.__next_cycle()
+
+    def rollback(self):
+        """ Discard the staged values and start the next cycle
+
+        Returns:
+            None
+        """
+        self.__next_cycle()
+
+    def __next_cycle(self):
+        self.__pending = {}
+        self.__seen = {}
+        self.__fetched = set()
+        self.suppressed = 0
+        self.__cycle += 1
+
+    def __changed(self, previous, value):
+        """ Check if the value differs from the previous one by more than the threshold """
+        if math.isnan(previous) or math.isnan(value):
+            return not (math.isnan(previous) and math.isnan(value))
+        if not self.threshold:
+            return value != previous
+        if previous == 0:
+            return value != 0
+        return abs(value - previous) > self.threshold * abs(previous)
@@ -0,0 +1,253 @@
+"""
+Tests of the remote_write receiver: the snappy and protobuf decoders, the ingester and the
+HTTP handler.
+"""
+
+import http.client
+import json
+import math
+import struct
+import threading
+import time
+import unittest
+from unittest import mock
+
+import remote_write
+from kafka_client.serializers import MetricPayloadEncoder
+from registry import metric_registry
+from remote_write import RemoteWriteIngester, RemoteWriteServer, decode_write_request, \
+    read_uvarint, snappy_decompress
+
+GAUGE_METRIC = "container_memory_usage_bytes"
+COUNTER_METRIC = "container_cpu_usage_seconds_total"
+
+
+def encode_uvarint(value):
+    """ Encode an unsigned varint """
+    output = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            output.append(byte | 0x80)
+        else:
+            output.append(byte)
+            return bytes(output)
+
+
+def encode_field(field_number, wire_type, value):
+    """ Encode a protobuf field: a varint (0), 8 bytes (1) or length-delimited bytes (2) """
+    key = encode_uvarint(field_number << 3 | wire_type)
+    if wire_type == 0:
+        return key + encode_uvarint(value)
+    if wire_type == 2:
+        return key + encode_uvarint(len(value)) + value
+    return key + value
+
+
+def encode_write_request(series):
+    """ Encode a `prometheus.WriteRequest` of the given (labels, samples) series """
+    message = b""
+    for labels, samples in series:
+        timeseries = b""
+        for name, value in labels.items():
+            timeseries += encode_field(1, 2, encode_field(1, 2, name.encode("utf-8")) +
+                                       encode_field(2, 2, value.encode("utf-8")))
+        for timestamp, value in samples:
+            timeseries += encode_field(2, 2, encode_field(1, 1, struct.pack("<d", value)) +
+                                       encode_field(2, 0, timestamp & (1 << 64) - 1))
+        message += encode_field(1, 2, timeseries)
+    return message
+
+
+def snappy_literal(data):
+    """ Encode the given data as a snappy block of literals (no compression) """
+    block = bytearray(encode_uvarint(len(data)))
+    for start in range(0, len(data), 1 << 16):
+        chunk = data[start:start + (1 << 16)]
+        if len(chunk) <= 60:
+            block.append((len(chunk) - 1) << 2)
+        else:
+            block.append(61 << 2)
+            block += (len(chunk) - 1).to_bytes(2, "little")
+        block += chunk
+    return bytes(block)
+
+
+class FakeProducer(object):
+    """ Keep the published messages instead of sending them to kafka """
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, payload, key=None):
+        self.messages.append((payload, key))
+
+
+class TestDecoders(unittest.TestCase):
+
+    def test_uvarint(self):
+        for value in (0, 1, 127, 128, 300, 1 << 35, (1 << 64) - 1):
+            self.assertEqual(read_uvarint(encode_uvarint(value) + b"\x00", 0),
+                             (value, len(encode_uvarint(value))))
+        with self.assertRaises(ValueError):
+            read_uvarint(b"\x80\x80", 0)
+
+    def test_write_request_round_trip(self):
+        series = [
+            ({"__name__": GAUGE_METRIC, "pod_name": "pod-ü", "namespace": "default"},
+             [(1700000000000, 2092.0), (1700000015000, 0.5)]),
+            ({"__name__": "up", "job": ""}, [(-1, -3.25)]),
+            ({"__name__": "empty"}, []),
+        ]
+        self.assertEqual(decode_write_request(encode_write_request(series)), series)
+
+    def test_write_request_special_values(self):
+        series = [({"__name__": "x"}, [(1, float("nan")), (2, float("inf"))])]
+        (_, samples), = decode_write_request(encode_write_request(series))
+        self.assertTrue(math.isnan(samples[0][1]))
+        self.assertEqual(samples[1], (2, float("inf")))
+
+    def test_write_request_skips_unknown_fields(self):
+        message = encode_field(3, 2, b"metadata") + encode_field(4, 0, 7) + \
+            encode_write_request([({"__name__": "x"}, [(1, 1.0)])])
+        self.assertEqual(decode_write_request(message), [({"__name__": "x"}, [(1, 1.0)])])
+
+    def test_write_request_truncated(self):
+        message = encode_write_request([({"__name__": GAUGE_METRIC}, [(1, 1.0), (2, 2.0)])])
+        for size in range(1, len(message)):
+            with self.assertRaises(ValueError, msg="size {}".format(size)):
+                decode_write_request(message[:size])
+
+    def test_write_request_corrupted(self):
+        with self.assertRaises(ValueError):
+            decode_write_request(encode_uvarint(1 << 3 | 7) + b"\x00")
+        with self.assertRaises(ValueError):
+            label = encode_field(1, 2, b"\xff\xfe")
+            decode_write_request(encode_field(1, 2, encode_field(1, 2, label)))
+
+
+@mock.patch.object(remote_write, "snappy", None)
+class TestPureSnappy(unittest.TestCase):
+
+    def test_literals(self):
+        for data in (b"", b"a", b"x" * 60, b"abc" * 1000, bytes(range(256)) * 300):
+            self.assertEqual(snappy_decompress(snappy_literal(data)), data)
+
+    def test_copies(self):
+        # "abcd" + a 1-byte offset copy of "abcd" + a 2-byte offset copy that overlaps itself
+        block = encode_uvarint(4 + 4 + 10) + b"\x0cabcd" + bytes([(4 - 4) << 2 | 1, 4]) + \
+            bytes([(10 - 1) << 2 | 2]) + (1).to_bytes(2, "little")
+        self.assertEqual(snappy_decompress(block), b"abcdabcd" + b"d" * 10)
+        # A 4-byte offset copy
+        block = encode_uvarint(6) + b"\x08xyz" + bytes([(3 - 1) << 2 | 3]) + \
+            (3).to_bytes(4, "little")
+        self.assertEqual(snappy_decompress(block), b"xyzxyz")
+
+    def test_truncated(self):
+        block = snappy_literal(b"hello world" * 20)
+        for size in range(0, len(block)):
+            with self.assertRaises(ValueError, msg="size {}".format(size)):
+                snappy_decompress(block[:size])
+        for block in (encode_uvarint(8) + b"\x0cabcd\x01", encode_uvarint(8) + b"\x0cabcd\x02\x04",
+                      encode_uvarint(100) + bytes([61 << 2]) + b"\x63"):
+            with self.assertRaises(ValueError):
+                snappy_decompress(block)
+
+    def test_corrupted(self):
+        # A copy before any output, a copy beyond the output and a wrong length
+        for block in (encode_uvarint(4) + bytes([1, 1]),
+                      encode_uvarint(8) + b"\x0cabcd" + bytes([1, 5]),
+                      encode_uvarint(5) + b"\x0cabcd"):
+            with self.assertRaises(ValueError):
+                snappy_decompress(block)
+
+
+class TestRemoteWriteIngester(unittest.TestCase):
+
+    def setUp(self):
+        self.producer = FakeProducer()
+        metrics = [metric_registry.get(GAUGE_METRIC), metric_registry.get(COUNTER_METRIC)]
+        self.ingester = RemoteWriteIngester(
+            self.producer, metrics, MetricPayloadEncoder(metric_registry.metrics()),
+            staleness=300)
+        self.now_ms = int(time.time() * 1000)
+
+    def ingest(self, series):
+        return self.ingester.ingest(snappy_literal(encode_write_request(series)))
+
+    def pod_labels(self, timestamp):
+        return ({"__name__": "kube_pod_labels", "pod": "pod-1", "label_vim_id": "vim-1",
+                 "label_ow_action": "action"}, [(timestamp, 1.0)])
+
+    def test_ingest(self):
+        labels = {"pod_name": "pod-1", "namespace": "default"}
+        published = self.ingest([
+            self.pod_labels(self.now_ms),
+            (dict(labels, __name__=GAUGE_METRIC, id="/a"), [(self.now_ms, 2.0)]),
+            (dict(labels, __name__=GAUGE_METRIC, id="/b"), [(self.now_ms, 3.0)]),
+            (dict(labels, __name__=COUNTER_METRIC), [(self.now_ms - 10000, 1.0),
+                                                     (self.now_ms, 6.0)]),
+            (dict(labels, __name__=GAUGE_METRIC, namespace="kube-system"), [(self.now_ms, 9.0)]),
+        ])
+        self.assertEqual(published, 2)
+        values = {}
+        for payload, key in self.producer.messages:
+            self.assertEqual(key, "vim-1")
+            sample, = json.loads(payload.decode("utf-8"))['data']
+            values[sample['name']] = sample['value']
+        # The sum of the series of the pod and the rate of the counter
+        self.assertEqual(values, {GAUGE_METRIC: "5", COUNTER_METRIC: "0.5"})
+
+    def test_sweep(self):
+        stale_ms = self.now_ms - 400 * 1000
+        labels = {"__name__": GAUGE_METRIC, "pod_name": "pod-1", "namespace": "default"}
+        # The labels of a vanished pod and a series of a pod without labels
+        self.ingest([self.pod_labels(stale_ms), (dict(labels, pod_name="pod-2"),
+                                                 [(stale_ms, 2.0)])])
+        self.assertEqual(self.ingester.sweep(), 2)
+        self.assertEqual(self.ingester.sweep(), 0)
+        # The labels of the pod were dropped, so its values are not published any more
+        self.assertEqual(self.ingest([(labels, [(self.now_ms, 2.0)])]), 0)
+        self.assertEqual(self.ingest([self.pod_labels(self.now_ms),
+                                      (labels, [(self.now_ms + 1, 2.0)])]), 1)
+
+
+class TestRemoteWriteHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.producer = FakeProducer()
+        ingester = RemoteWriteIngester(self.producer, [metric_registry.get(GAUGE_METRIC)],
+                                       MetricPayloadEncoder(metric_registry.metrics()))
+        self.server = RemoteWriteServer(0, ingester, address="127.0.0.1")
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, body, path=remote_write.WRITE_PATH):
+        connection = http.client.HTTPConnection(*self.server.server_address, timeout=5)
+        try:
+            connection.request("POST", path, body=body,
+                               headers={"Content-Encoding": "snappy",
+                                        "Content-Type": "application/x-protobuf"})
+            return connection.getresponse().status
+        finally:
+            connection.close()
+
+    def test_status(self):
+        body = snappy_literal(encode_write_request([({"__name__": GAUGE_METRIC}, [(1, 1.0)])]))
+        self.assertEqual(self.post(body), 204)
+        self.assertEqual(self.post(body, path="/write"), 404)
+
+    def test_invalid_requests(self):
+        message = encode_write_request([({"__name__": GAUGE_METRIC}, [(1, 1.0)])])
+        for body in (snappy_literal(message)[:-3], snappy_literal(message[:-3]),
+                     b"\xff\xff\xff", snappy_literal(b"\x0f\x00")):
+            self.assertEqual(self.post(body), 400)
+        self.assertEqual(self.producer.messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+Tests of the encoding of the kafka messages.
+"""
+
+import json
+import unittest
+
+from kafka_client.serializers import MetricPayloadEncoder
+from registry import metric_registry
+
+PACKET_LOSS_METRIC = "container_network_receive_packet_loss_percentage"
+GAUGE_METRIC = "container_memory_usage_bytes"
+
+
+class TestMetricPayloadEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = MetricPayloadEncoder(metric_registry.metrics(), backend="json")
+
+    def decode(self, payload):
+        return json.loads(payload.decode("utf-8"))
+
+    def test_metric_message(self):
+        payload = self.encoder.encode("c1", GAUGE_METRIC, [("2019-04-24T07:56:34.158000Z", "5"),
+                                                           ("2019-04-24T07:56:54.158000Z", "6")])
+        self.assertEqual(self.decode(payload), {
+            "container_id": "c1", "type": "gauge",
+            "data": [{"timestamp": "2019-04-24T07:56:34.158000Z", "unit": "bytes",
+                      "type": "gauge", "name": GAUGE_METRIC, "value": "5"},
+                     {"timestamp": "2019-04-24T07:56:54.158000Z", "unit": "bytes",
+                      "type": "gauge", "name": GAUGE_METRIC, "value": "6"}]})
+
+    def test_derived_metric_message(self):
+        # The shape of the packet loss messages that the consumers route on: the `type` of the
+        # message is the name of the metric and the value is a number
+        for value in ("0", 0.0):
+            payload = self.encoder.encode("c1", PACKET_LOSS_METRIC,
+                                          [("2019-04-24T07:56:34.158000Z", value)])
+            self.assertEqual(self.decode(payload), {
+                "container_id": "c1", "type": PACKET_LOSS_METRIC,
+                "data": [{"timestamp": "2019-04-24T07:56:34.158000Z", "unit": "%",
+                          "type": "counter", "name": PACKET_LOSS_METRIC, "value": 0.0}]})
+
+    def test_container_message(self):
+        samples = [self.encoder.encode_sample(GAUGE_METRIC, "t", "5"),
+                   self.encoder.encode_sample(PACKET_LOSS_METRIC, "t", "12.5")]
+        message = self.decode(self.encoder.encode_container("c1", samples, 2))
+        self.assertEqual((message['schema_version'], message['container_id']), (2, "c1"))
+        self.assertEqual([sample['value'] for sample in message['data']], ["5", 12.5])
+
+
+if __name__ == '__main__':
+    unittest.main()
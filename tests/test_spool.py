@@ -0,0 +1,254 @@
+"""
+Tests of the disk-backed spool of the kafka messages, of their replay and of the publishing
+from many threads.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from kafka.errors import KafkaError
+from kafka.future import Future
+
+from kafka_client import producer as producer_module
+from kafka_client.producer import Producer
+from kafka_client.spool import Spool, SEGMENT_SUFFIX
+
+RECORDS = [(b"container-1", b'{"value":"1"}'), (None, b'{"value":"2"}'), (b"", b""),
+           (b"container-\xc3\xbc", b"x" * 1000)]
+
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def spool(self, **kwargs):
+        return Spool(self.directory, **kwargs)
+
+    def append(self, spool, records):
+        for key, value in records:
+            spool.append(value, key)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if name.endswith(SEGMENT_SUFFIX))
+
+    def test_round_trip(self):
+        spool = self.spool()
+        self.append(spool, RECORDS)
+        self.assertEqual(spool.read(10), RECORDS)
+        spool.commit()
+        self.assertEqual(spool.read(10), [])
+        self.assertEqual(spool.size(), 0)
+        self.assertEqual(self.segments(), [])
+
+    def test_read_in_steps(self):
+        spool = self.spool(segment_bytes=40)
+        self.append(spool, RECORDS)
+        self.assertGreater(len(self.segments()), 1)
+        self.assertEqual(spool.read(1) + spool.read(2) + spool.read(10), RECORDS)
+        spool.commit()
+        self.assertEqual(spool.read(10), [])
+
+    def test_rollback(self):
+        spool = self.spool()
+        self.append(spool, RECORDS)
+        self.assertEqual(spool.read(2), RECORDS[:2])
+        spool.rollback()
+        self.assertEqual(spool.read(10), RECORDS)
+
+    def test_appended_while_read(self):
+        spool = self.spool()
+        self.append(spool, RECORDS[:2])
+        self.assertEqual(spool.read(10), RECORDS[:2])
+        self.append(spool, RECORDS[2:])
+        spool.commit()
+        self.assertEqual(spool.read(10), RECORDS[2:])
+
+    def test_restart_resumes_the_committed_offset(self):
+        spool = self.spool()
+        self.append(spool, RECORDS)
+        self.assertEqual(spool.read(1), RECORDS[:1])
+        spool.commit()
+        # Read but not committed, e.g. the service was restarted before the flush
+        self.assertEqual(spool.read(2), RECORDS[1:3])
+        self.assertEqual(self.spool().read(10), RECORDS[1:])
+
+    def test_truncated_record(self):
+        spool = self.spool()
+        self.append(spool, RECORDS[:2])
+        # A partially written record, e.g. the process was killed while appending
+        segment, = self.segments()
+        with open(os.path.join(self.directory, segment), "ab") as f:
+            f.write(b"\x00\x00\x00\x01k\x00\x00\x00\x10{")
+        spool = self.spool()
+        self.assertEqual(spool.read(10), RECORDS[:2])
+        spool.commit()
+        self.assertEqual(self.segments(), [])
+        self.append(spool, RECORDS[2:])
+        self.assertEqual(spool.read(10), RECORDS[2:])
+
+    def test_eviction(self):
+        spool = self.spool(segment_bytes=100, max_bytes=250)
+        records = [(None, "{:03d}".format(i).encode() * 10) for i in range(20)]
+        self.append(spool, records)
+        self.assertLessEqual(spool.size(), 250 + 100)
+        read = spool.read(100)
+        # The oldest segments are evicted and the newest records are kept in order
+        self.assertEqual(read, records[-len(read):])
+        self.assertLess(len(read), len(records))
+
+    def test_evicted_while_read(self):
+        spool = self.spool(segment_bytes=100, max_bytes=250)
+        records = [(None, "{:03d}".format(i).encode() * 10) for i in range(20)]
+        self.append(spool, records[:5])
+        self.assertEqual(spool.read(2), records[:2])
+        self.append(spool, records[5:])
+        spool.commit()
+        read = spool.read(100)
+        self.assertEqual(read, records[-len(read):])
+
+
+class FakeKafkaProducer(object):
+    """ Acknowledge or fail the sends, as they are given in `results` """
+
+    results = []
+
+    def __init__(self, **configs):
+        self.sent = []
+
+    def partitions_for(self, topic):
+        return {0}
+
+    def send(self, topic, value, key=None):
+        self.sent.append((key, value))
+        future = Future()
+        result = self.results.pop(0) if self.results else True
+        if result:
+            future.success(None)
+        else:
+            future.failure(KafkaError("Not delivered"))
+        return future
+
+    def flush(self, timeout=None):
+        pass
+
+    def close(self, timeout=None):
+        pass
+
+
+class TestReplay(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(producer_module, "KafkaProducer", FakeKafkaProducer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FakeKafkaProducer.results = []
+        self.directory = tempfile.mkdtemp()
+        self.spool = Spool(self.directory)
+        self.producer = Producer(topic="test", spool=self.spool)
+        # The replay starts once a flush delivered its messages
+        self.producer.publish({"value": "live"})
+        self.producer.flush()
+        for key, value in RECORDS[:2]:
+            self.spool.append(value, key)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_acknowledged_replay_is_consumed(self):
+        self.assertEqual(self.producer.replay(10), 2)
+        counters = self.producer.flush()
+        self.assertEqual((counters["acked"], counters["replayed"]), (2, 2))
+        self.assertEqual(self.spool.read(10), [])
+
+    def test_failed_replay_is_kept(self):
+        FakeKafkaProducer.results = [True, False]
+        self.assertEqual(self.producer.replay(10), 2)
+        counters = self.producer.flush()
+        self.assertEqual((counters["failed"], counters["spooled"]), (1, 1))
+        # Replayed again, without spooling a copy of the failed message
+        self.assertEqual(self.spool.read(10), RECORDS[:2])
+
+    def test_live_failures_are_spooled(self):
+        FakeKafkaProducer.results = [False]
+        self.producer.publish({"value": "3"}, "container-1")
+        self.producer.flush()
+        self.assertEqual(self.spool.read(10), RECORDS[:2] + [(b"container-1", b'{"value":"3"}')])
+
+
+class SlowKafkaProducer(FakeKafkaProducer):
+    """ Widen the window of the races between the creation, the sends and the closing """
+
+    instances = []
+
+    def __init__(self, **configs):
+        super().__init__(**configs)
+        self.closed = False
+        self.instances.append(self)
+
+    def partitions_for(self, topic):
+        time.sleep(0.05)
+        return {0}
+
+    def send(self, topic, value, key=None):
+        assert not self.closed, "KafkaProducer already closed!"
+        time.sleep(0.001)
+        return super().send(topic, value, key)
+
+    def close(self, timeout=None):
+        self.closed = True
+
+
+class TestConcurrentPublishing(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(producer_module, "KafkaProducer", SlowKafkaProducer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        SlowKafkaProducer.instances = []
+        self.producer = Producer(topic="test")
+
+    def publish(self, count, errors):
+        try:
+            for i in range(count):
+                self.producer.publish({"value": str(i)})
+        except Exception as ex:
+            errors.append(ex)
+
+    def test_single_producer(self):
+        errors = []
+        threads = [threading.Thread(target=self.publish, args=(10, errors)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(len(SlowKafkaProducer.instances), 1)
+        self.assertEqual(self.producer.flush()["acked"], 80)
+
+    def test_close_while_publishing(self):
+        errors = []
+        threads = [threading.Thread(target=self.publish, args=(50, errors)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for _ in range(10):
+            time.sleep(0.01)
+            self.producer.close()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        counters = self.producer.flush()
+        self.assertEqual(counters["acked"] + counters["failed"], 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
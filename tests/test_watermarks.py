@@ -0,0 +1,73 @@
+"""
+Tests of the staged state of a cycle: the watermarks and the delta suppression.
+"""
+
+import unittest
+
+from suppression import DeltaSuppressor
+from watermarks import WatermarkStore
+
+
+class TestWatermarkStore(unittest.TestCase):
+
+    def setUp(self):
+        self.watermarks = WatermarkStore()
+        self.watermarks.mark_fetched("m")
+        self.watermarks.select_new("m", "a", [[1, "1"]])
+        self.watermarks.select_new("m", "b", [[1, "1"]])
+        self.watermarks.commit()
+
+    def test_select_new(self):
+        self.assertEqual(self.watermarks.select_new("m", "a", [[1, "1"], [2, "2"]]), [[2, "2"]])
+        self.assertEqual(self.watermarks.get_query_start(["m"], (10, 20)), 1)
+
+    def test_fetched_metric_drops_missing_series(self):
+        self.watermarks.mark_fetched("m")
+        self.watermarks.select_new("m", "a", [[2, "2"]])
+        self.watermarks.commit()
+        self.assertEqual(self.watermarks.select_new("m", "b", [[1, "1"]]), [[1, "1"]])
+
+    def test_partially_parsed_metric_keeps_missing_series(self):
+        # The response failed after the series of `a`, so `m` was not marked as fetched
+        self.watermarks.select_new("m", "a", [[2, "2"]])
+        self.watermarks.commit()
+        self.assertEqual(self.watermarks.select_new("m", "a", [[2, "2"]]), [])
+        self.assertEqual(self.watermarks.select_new("m", "b", [[1, "1"], [2, "2"]]), [[2, "2"]])
+
+    def test_rollback(self):
+        self.watermarks.mark_fetched("m")
+        self.watermarks.select_new("m", "a", [[2, "2"]])
+        self.watermarks.rollback()
+        self.assertEqual(self.watermarks.select_new("m", "a", [[2, "2"]]), [[2, "2"]])
+        self.assertEqual(self.watermarks.select_new("m", "b", [[2, "2"]]), [[2, "2"]])
+
+
+class TestDeltaSuppressor(unittest.TestCase):
+
+    def setUp(self):
+        self.suppressor = DeltaSuppressor(heartbeat_cycles=0)
+        self.suppressor.mark_fetched("m")
+        self.assertTrue(self.suppressor.should_publish("m", "a", "1"))
+        self.assertTrue(self.suppressor.should_publish("m", "b", "1"))
+        self.suppressor.commit()
+
+    def test_unchanged_values_are_suppressed(self):
+        self.assertFalse(self.suppressor.should_publish("m", "a", "1"))
+        self.assertTrue(self.suppressor.should_publish("m", "a", "2"))
+        self.assertEqual(self.suppressor.suppressed, 1)
+
+    def test_fetched_metric_evicts_missing_containers(self):
+        self.suppressor.mark_fetched("m")
+        self.suppressor.mark_seen("m", "a")
+        self.suppressor.commit()
+        self.assertFalse(self.suppressor.should_publish("m", "a", "1"))
+        self.assertTrue(self.suppressor.should_publish("m", "b", "1"))
+
+    def test_partially_parsed_metric_keeps_missing_containers(self):
+        self.suppressor.mark_seen("m", "a")
+        self.suppressor.commit()
+        self.assertFalse(self.suppressor.should_publish("m", "b", "1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
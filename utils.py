@@ -3,14 +3,20 @@ A module that includes a set of utilities.
 """
 
 from datetime import datetime, timedelta
-import urllib.parse
+from functools import lru_cache
 from dateutil import tz
-from settings import PROMETHEUS_METRICS_LIST, SCHEDULER_SECONDS, PROMETHEUS_POLLING_STEP
+from prometheus_client.v1.query import Query
+from registry import metric_registry, get_metric_function
+from settings import SCHEDULER_SECONDS, PROMETHEUS_POLLING_STEP
 
 
+@lru_cache(maxsize=1024)
 def convert_unix_timestamp_to_datetime_str(unix_ts):
     """ Convert a unix timestamp in stringify datetime (UTC)
 
+    Within a cycle, almost all the samples share the same step-aligned timestamp, so the
+    results are memoized. The string is formatted manually since `strftime` is slower.
+
     Args:
         unix_ts (int): The timestamp in unix
 
@@ -26,7 +32,9 @@ def convert_unix_timestamp_to_datetime_str(unix_ts):
         2018-05-24T12:35:50.000000Z
     """
     timestamp = datetime.utcfromtimestamp(unix_ts)
-    return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return '%04d-%02d-%02dT%02d:%02d:%02d.%06dZ' % (
+        timestamp.year, timestamp.month, timestamp.day, timestamp.hour, timestamp.minute,
+        timestamp.second, timestamp.microsecond)
 
 
 def convert_utc_timestamp_in_timezone(utc_timestamp, timezone="GMT"):
@@ -54,62 +62,123 @@ def apply_function_per_metric(metric_type):
     Returns:
         str: the name of the function
     """
-    net_metrics = ["container_network_receive_bytes_total",
-                   "container_network_receive_errors_total",
-                   "container_network_receive_packets_dropped_total",
-                   "container_network_receive_packets_total",
-                   "container_network_transmit_bytes_total",
-                   "container_network_transmit_errors_total",
-                   "container_network_transmit_packets_dropped_total",
-                   "container_network_transmit_packets_total", ]
-
-    computational_metrics = ["container_cpu_usage_seconds_total",
-                             "container_cpu_user_seconds_total",
-                             "container_cpu_system_seconds_total ",
-                             "container_cpu_cfs_throttled_seconds_total",
-                             "container_fs_writes_bytes_total",
-                             "container_fs_reads_bytes_total", ]
-
-    if metric_type in net_metrics or metric_type in computational_metrics:
-        return "rate"
-    return "avg_over_time"
-
-
-def retrieve_values(query, metric):
-    """ Retrieve the values by given metric
+    entry = metric_registry.get(metric_type)
+    if entry is not None:
+        return entry['function']
+    return get_metric_function(metric_type)
+
+
+def build_metric_expression(metric):
+    """ Build the PromQL expression that aggregates the values of the given metric per pod
+
+    A derived metric, i.e. one that has an `expression` in the `PROMETHEUS_METRICS_LIST`, is
+    evaluated by its expression, where each `{<metric>}` is replaced by the per pod
+    expression of the metric.
 
     Args:
-        query (object): The QueryRange object
         metric (str): The name of the metric
 
     Returns:
-        object: a requests object
+        str: the PromQL expression
     """
-    utc_now = datetime.utcnow()
-
-    query = """sum(
-      max(kube_pod_labels{label_ow_action!=""}) by (label_ow_action, pod, label_vim_id)
-      *
-      on(pod)
-      group_right(label_ow_action, label_vim_id)
-      label_replace(
-        sum by (pod_name) (%(metric_function)s(%(metric_name)s{namespace="%(namespace)s"}[1m])), 
-        "pod", 
-        "$1", 
-        "pod_name", 
-        "(.+)"
-      )
-    ) by (pod, label_ow_action, label_vim_id)""" \
-            % {"metric_function": apply_function_per_metric(metric), "metric_name": metric,
-               "namespace": "default"}
-
-    url_query = urllib.parse.quote(query)
-    from_dt = utc_now - timedelta(seconds=int(SCHEDULER_SECONDS))
+    return metric_registry.get_expression(metric)
+
+
+def get_query_window(window=None):
+    """ Get the time window of the queries
+
+    Args:
+        window (tuple, optional): The start and the end unix timestamps of the window. By
+            default, the latest `SCHEDULER_SECONDS`.
+
+    Returns:
+        tuple: the start and the end datetime in str (UTC)
+    """
+    if window is None:
+        to_dt = datetime.utcnow()
+        from_dt = to_dt - timedelta(seconds=int(SCHEDULER_SECONDS))
+    else:
+        from_dt, to_dt = (datetime.utcfromtimestamp(unix_ts) for unix_ts in window)
     from_time = from_dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-    to_time = utc_now.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    to_time = to_dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    return from_time, to_time
+
+
+def execute_query(query, url_query, instant=False, window=None):
+    """ Perform the given query in the given window
+
+    Args:
+        query (object): The Query or the QueryRange object
+        url_query (str): The URL-quoted PromQL query
+        instant (bool): True to evaluate only the end of the window using a QueryRange object.
+            A Query object always evaluates only the end of the window.
+        window (tuple, optional): The start and the end unix timestamps of the window. By
+            default, the latest `SCHEDULER_SECONDS`.
+
+    Returns:
+        object: a requests object
+    """
+    from_time, to_time = get_query_window(window)
+    if isinstance(query, Query):
+        return query.get(url_query, time=to_time)
+    if instant:
+        from_time = to_time
     return query.get(url_query, from_time=from_time, to_time=to_time, step=PROMETHEUS_POLLING_STEP)
 
 
+def retrieve_values(query, metric, join=True, window=None):
+    """ Retrieve the values by given metric
+
+    Args:
+        query (object): The Query or the QueryRange object
+        metric (str): The name of the metric
+        join (bool): True to join the values with the `kube_pod_labels` in Prometheus. False
+            to get the values per `pod_name`.
+        window (tuple, optional): The start and the end unix timestamps of the window. By
+            default, the latest `SCHEDULER_SECONDS`.
+
+    Returns:
+        object: a requests object
+    """
+    return execute_query(query, metric_registry.get_query(metric, join=join), window=window)
+
+
+def retrieve_batch_values(query, metrics, join=True, window=None):
+    """ Retrieve the values of many metrics in a single request
+
+    The expressions of the metrics are combined with the `or` operator and each one keeps its
+    metric name in the `metric_name` label, so the `kube_pod_labels` join is evaluated once.
+
+    Args:
+        query (object): The Query or the QueryRange object
+        metrics (list): The names of the metrics
+        join (bool): True to join the values with the `kube_pod_labels` in Prometheus. False
+            to get the values per `pod_name`.
+        window (tuple, optional): The start and the end unix timestamps of the window. By
+            default, the latest `SCHEDULER_SECONDS`.
+
+    Returns:
+        object: a requests object
+    """
+    return execute_query(query, metric_registry.get_batch_query(metrics, join=join),
+                         window=window)
+
+
+def convert_vector_to_matrix(results):
+    """ Convert the results of an instant query (`vector`) to the `matrix` format, i.e. the
+    single `value` of each result is kept as the only item of its `values` list
+
+    Args:
+        results (iterable): The `result` list of an instant query
+
+    Yields:
+        dict: each result in the `matrix` format
+    """
+    for result in results:
+        result['values'] = [result.pop('value')] if 'value' in result else []
+        yield result
+
+
 def calculate_packet_loss_values(dropped_packets_rate, total_packets_rate):
     """ Calculate the packet loss (percentage)
 
@@ -134,10 +203,8 @@ def get_unit_by_metric(metric):
     Returns:
         str: the unit
     """
-    for item in PROMETHEUS_METRICS_LIST:
-        if item['name'] == metric:
-            return item['unit']
-    return ""
+    entry = metric_registry.get(metric)
+    return entry['unit'] if entry is not None else ""
 
 
 def get_type_by_metric(metric):
@@ -149,7 +216,5 @@ def get_type_by_metric(metric):
     Returns:
         str: the metric's type
     """
-    for item in PROMETHEUS_METRICS_LIST:
-        if item['name'] == metric:
-            return item['type']
-    return ""
+    entry = metric_registry.get(metric)
+    return entry['type'] if entry is not None else ""
@@ -0,0 +1,202 @@
+"""
+A module that keeps the timestamp of the latest published value per metric and container.
+"""
+
+import json
+import logging.config
+import os
+from settings import LOGGING
+from state import encode_field, decode_field
+
+logging.config.dictConfig(LOGGING)
+logger = logging.getLogger("publisher")
+error_logger = logging.getLogger("errors")
+
+
+class WatermarkStore(object):
+    """WatermarkStore Class.
+
+    It keeps a watermark, i.e. the unix timestamp of the latest published value, per
+    (metric, container). The queries start from the oldest watermark of their metrics and
+    only the values after the watermark of each series are published, so a failed cycle is
+    backfilled by the next one without duplicates.
+
+    The watermarks of a cycle are staged and become effective through `commit()`, once the
+    messages are delivered; `rollback()` discards them, so the next cycle re-fetches the
+    values. The series that are missing from a fully parsed response are dropped; the
+    watermarks of a response that failed while it was parsed are only advanced.
+
+    If a state backend is given, the watermarks are kept in its `watermarks` table instead
+    of the file, so they are shared among the replicas; `refresh()` re-loads them.
+
+    Attributes:
+        path (str, optional): The JSON file where the watermarks are persisted (if any)
+        max_backfill (int): The max seconds before the end of the window that a query starts
+        backend (object, optional): The MemoryStateBackend or RedisStateBackend object
+
+    Methods:
+        refresh(): re-load the watermarks from the state backend (if any)
+        get_query_start(metric_names, window): get the start of the window of a query
+        mark_fetched(metric_name): stage that the metric was fetched in the cycle
+        select_new(metric_name, container_id, values): keep the values after the watermark
+        commit(): apply the staged watermarks
+        rollback(): discard the staged watermarks
+    """
+
+    def __init__(self, path=None, max_backfill=3600, backend=None):
+        """Class Constructor."""
+        self.path = path
+        self.max_backfill = max_backfill
+        self.backend = backend
+        self.__watermarks = {}
+        self.__pending = {}
+        self.__fetched = set()
+        if backend is not None:
+            self.refresh()
+        elif path:
+            self.load()
+
+    def refresh(self):
+        """ Re-load the watermarks from the state backend (if any), e.g. the ones committed
+        by another replica
+
+        Returns:
+            None
+        """
+        if self.backend is None:
+            return
+        try:
+            table = self.backend.get_all("watermarks")
+        except Exception as ex:
+            error_logger.error("Unable to load the watermarks from the state: {}".format(ex))
+            return
+        watermarks = {}
+        for field, watermark in table.items():
+            metric_name, container_id = decode_field(field)
+            watermarks.setdefault(metric_name, {})[container_id] = float(watermark)
+        self.__watermarks = watermarks
+
+    def load(self):
+        """ Load the persisted watermarks (if any)
+
+        Returns:
+            None
+        """
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.__watermarks = json.load(f)
+        except (OSError, ValueError) as ex:
+            error_logger.error("Unable to load the watermarks from {}: {}".format(self.path, ex))
+            return
+        logger.info("Loaded the watermarks of {} metrics".format(len(self.__watermarks)))
+
+    def save(self):
+        """ Persist the watermarks atomically
+
+        Returns:
+            None
+        """
+        temp_path = "{}.tmp".format(self.path)
+        try:
+            with open(temp_path, "w") as f:
+                json.dump(self.__watermarks, f)
+            os.replace(temp_path, self.path)
+        except OSError as ex:
+            error_logger.error("Unable to save the watermarks in {}: {}".format(self.path, ex))
+
+    def get_query_start(self, metric_names, window):
+        """ Get the start of the window of a query: the oldest watermark of its metrics,
+        bounded by the `max_backfill`
+
+        Args:
+            metric_names (list): The names of the metrics of the query
+            window (tuple): The start and the end unix timestamps of the cycle
+
+        Returns:
+            float: the unix timestamp of the start of the query window
+        """
+        window_start, window_end = window
+        watermarks = [watermark for metric_name in metric_names
+                      for watermark in self.__watermarks.get(metric_name, {}).values()]
+        if not watermarks:
+            return window_start
+        return min(window_start, max(min(watermarks), window_end - self.max_backfill))
+
+    def mark_fetched(self, metric_name):
+        """ Stage that the response of the metric was fully parsed in the cycle, so its series
+        that are missing from the response are dropped on `commit()`
+
+        Args:
+            metric_name (str): The name of the metric
+
+        Returns:
+            None
+        """
+        self.__pending.setdefault(metric_name, {})
+        self.__fetched.add(metric_name)
+
+    def select_new(self, metric_name, container_id, values):
+        """ Keep the values after the watermark of the series and stage the new watermark
+
+        Args:
+            metric_name (str): The name of the metric
+            container_id (str): The container ID
+            values (list): The [timestamp, value] pairs of the series, in time order
+
+        Returns:
+            list: the values that have not been published yet
+        """
+        watermark = self.__watermarks.get(metric_name, {}).get(container_id)
+        if watermark is not None:
+            values = [value for value in values if value[0] > watermark]
+        pending = self.__pending.setdefault(metric_name, {})
+        if values:
+            pending[container_id] = values[-1][0]
+        elif watermark is not None:
+            pending[container_id] = watermark
+        return values
+
+    def commit(self):
+        """ Apply the staged watermarks of the metrics that were fetched in the cycle
+
+        Returns:
+            None
+        """
+        if self.backend is not None:
+            self.__save_changes()
+        for metric_name, watermarks in self.__pending.items():
+            if metric_name in self.__fetched:
+                self.__watermarks[metric_name] = watermarks
+            else:
+                self.__watermarks.setdefault(metric_name, {}).update(watermarks)
+        self.__pending = {}
+        self.__fetched = set()
+        if self.path and self.backend is None:
+            self.save()
+
+    def rollback(self):
+        """ Discard the staged watermarks
+
+        Returns:
+            None
+        """
+        self.__pending = {}
+        self.__fetched = set()
+
+    def __save_changes(self):
+        """ Write the changed and the dropped watermarks of the cycle in the state backend """
+        changed, dropped = {}, []
+        for metric_name, watermarks in self.__pending.items():
+            previous = self.__watermarks.get(metric_name, {})
+            for container_id, watermark in watermarks.items():
+                if previous.get(container_id) != watermark:
+                    changed[encode_field(metric_name, container_id)] = repr(float(watermark))
+            if metric_name in self.__fetched:
+                dropped.extend(encode_field(metric_name, container_id)
+                               for container_id in previous if container_id not in watermarks)
+        try:
+            self.backend.update("watermarks", changed, dropped)
+        except Exception as ex:
+            error_logger.error("Unable to save the watermarks in the state: {}".format(ex))
@@ -2,164 +2,415 @@
 This module operates as the entry-point of this project.
 """
 
-import json
 import logging.config
 import time
-import schedule
-from kafka import KafkaProducer
-from kafka.errors import KafkaError
-from prometheus_client.v1 import query_range
-from settings import LOGGING, SCHEDULER_SECONDS, PROMETHEUS_METRICS_LIST, KAFKA_API_VERSION, \
-    KAFKA_SERVER, KAFKA_KUBERNETES_TOPIC
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from derived import DerivedMetricsStage
+from instrumentation import start_http_server, QUERY_DURATION, QUERY_RESPONSE_SIZE, \
+    QUERY_FAILURES, SERIES_PARSED, SPOOL_BYTES, MESSAGES
+from kafka_client.producer import Producer, get_message_key
+from kafka_client.serializers import MetricPayloadEncoder
+from kafka_client.spool import Spool
+from pod_labels import PodLabelsIndex
+from scheduler import AlignedScheduler
+from prometheus_client.v1 import query, query_range
+from prometheus_client.v1.parser import stream_results
+from registry import metric_registry
+from remote_write import RemoteWriteIngester, RemoteWriteServer, run_forever
+from sharding import filter_metrics, owns_container
+from settings import LOGGING, SCHEDULER_SECONDS, KAFKA_FLUSH_TIMEOUT, \
+    PROMETHEUS_MAX_CONCURRENT_QUERIES, PROMETHEUS_QUERY_BATCH_SIZE, PROMETHEUS_POD_LABELS_TTL, \
+    PROMETHEUS_QUERY_MODE, PROMETHEUS_STREAM_RESPONSES, KAFKA_JSON_BACKEND, KAFKA_PAYLOAD_MODE, \
+    WATERMARKS_ENABLED, WATERMARKS_FILE, WATERMARKS_MAX_BACKFILL_SECONDS, KAFKA_SPOOL_DIR, \
+    KAFKA_SPOOL_SEGMENT_BYTES, KAFKA_SPOOL_MAX_BYTES, KAFKA_SPOOL_REPLAY_MAX_MESSAGES, \
+    DERIVED_METRICS_LIST, METRICS_PORT, SUPPRESSION_ENABLED, SUPPRESSION_THRESHOLD, \
+    SUPPRESSION_HEARTBEAT_CYCLES, STATE_BACKEND, STATE_REDIS_URL, STATE_KEY_PREFIX, \
+    STATE_LEADER_LOCK, SHARD_INDEX, INGESTION_MODE, REMOTE_WRITE_PORT, \
+    REMOTE_WRITE_STALENESS_SECONDS
 from utils import convert_unix_timestamp_to_datetime_str, retrieve_values, \
-    calculate_packet_loss_values
+    retrieve_batch_values, convert_vector_to_matrix
+from state import get_state_backend
+from suppression import DeltaSuppressor
+from watermarks import WatermarkStore
 
 logging.config.dictConfig(LOGGING)
 logger = logging.getLogger("publisher")
 error_logger = logging.getLogger("errors")
 
+# The constant parts (type, unit, name) of the messages are encoded once per metric
+payload_encoder = MetricPayloadEncoder(metric_registry.metrics(), backend=KAFKA_JSON_BACKEND)
 
-def main():
-    """main process"""
-    producer = KafkaProducer(bootstrap_servers=KAFKA_SERVER,
-                             api_version=KAFKA_API_VERSION,
-                             value_serializer=lambda v: json.dumps(v).encode('utf-8'))
-    prom_ql = query_range.QueryRange(token=None)
+# The metrics that are collected by this replica; the derived ones are computed, not queried
+SHARD_METRICS_LIST = filter_metrics(metric_registry.collected_metrics())
 
-    # Keep metrics for the packet loss calculation
-    tx_rx_metrics = {}
+# The version of the per container messages, i.e. `{"schema_version", "container_id",
+# "data": [{"timestamp", "unit", "type", "name", "value"}, ...]}`. The per metric messages
+# have no version.
+CONTAINER_PAYLOAD_SCHEMA_VERSION = 2
 
-    for metric in PROMETHEUS_METRICS_LIST:
+
+def main(producer, prom_ql, pod_labels=None, window=None, watermarks=None, suppressor=None,
+         state=None):
+    """main process
+
+    Args:
+        producer (object): The long-lived kafka_client.producer.Producer object
+        prom_ql (object): The long-lived Query or QueryRange object
+        pod_labels (object, optional): The long-lived PodLabelsIndex object. If it is None,
+            the pod labels are joined in Prometheus.
+        window (tuple, optional): The start and the end unix timestamps of the cycle; every
+            query of the cycle uses it. By default, the latest `SCHEDULER_SECONDS`.
+        watermarks (object, optional): The long-lived WatermarkStore object. If it is given,
+            the queries start from the watermarks and all the new values are published.
+            Otherwise, only the latest value of each container is published.
+        suppressor (object, optional): The long-lived DeltaSuppressor object. If it is given,
+            only the series whose latest value changed (or is due for a heartbeat) are
+            published.
+        state (object, optional): The long-lived state backend. If it is given, only the
+            replica that acquires the lock of the cycle runs it.
+    """
+    if window is None:
+        window_end = time.time()
+        window = (window_end - int(SCHEDULER_SECONDS), window_end)
+
+    # The replicas of the same shard run each cycle once, by the one that gets its lock. If the
+    # state backend is unavailable, the cycle runs unlocked: the replicas may publish the same
+    # values, instead of none of them publishing anything.
+    if state is not None:
         try:
-            # Load the values for the requested metric for any running container
-            # having the label 'vim_id'
-            response = retrieve_values(prom_ql, metric['name'])
-            if response.status_code != 200:
-                error_logger.error("GET {} - {}".format(response.url, response.text))
-                continue
+            leader = state.acquire_lock("cycle:{}".format(int(window[1])),
+                                        int(SCHEDULER_SECONDS) * 1000)
+        except Exception as ex:
+            error_logger.error("Unable to acquire the lock of the cycle; run it unlocked: "
+                               "{}".format(ex))
+            leader = True
+        if not leader:
+            logger.info("Skip the cycle; another replica is the leader of it")
+            return
+
+    if not producer.connect() and producer.spool is None:
+        error_logger.error("Skip the cycle; the kafka bus is not available")
+        return
+
+    # Resume from the state committed by the latest leader (if shared)
+    if watermarks is not None:
+        watermarks.refresh()
+    if suppressor is not None:
+        suppressor.start_cycle(int(window[1] // int(SCHEDULER_SECONDS)))
 
-            response_body = response.json()
-            result_type = response_body['data'].get('resultType')
-            if result_type != "matrix":
-                logger.warning("The `resultType` is not the matrix. It is `{}`".format(result_type))
+    if pod_labels is not None:
+        try:
+            pod_labels.refresh(prom_ql, window)
+        except Exception as ex:
+            error_logger.exception(ex)
 
+    # Keep metrics for the derived metrics (e.g. packet loss) calculation
+    derived_metrics = DerivedMetricsStage(DERIVED_METRICS_LIST)
+    # Keep the encoded values per container ID if a single message per container is published
+    container_samples = {} if KAFKA_PAYLOAD_MODE == "container" else None
+    # The metrics whose response was fully parsed; the series of the rest (e.g. after a timeout
+    # or a truncated body) that were not parsed are kept by the watermarks and the suppressor
+    parsed_metrics = set()
+
+    for metrics, series in fetch_metrics(prom_ql, SHARD_METRICS_LIST, pod_labels, window,
+                                         watermarks):
+        try:
             # The response of the `query_range` request returns the result type (`matrix`) and
             # a list of results. Each object in results list includes one or more values of the
             # requested metric per container ID; actually, the `label_vim_id` key reflects
-            # the container ID.
-            for result in response_body['data'].get('result', []):
-                metric_values = []
+            # the container ID. The series are processed while they are parsed, one by one.
+            for metric, result in series:
                 osm_container_id = result.get('metric', {}).get('label_vim_id', None)
                 # Skip process if the container is not relevant with OSM
                 if osm_container_id is None:
                     continue
+                # Skip process if the container is owned by another replica
+                if not owns_container(osm_container_id):
+                    continue
+
+                # Keep all the new values for the requested metric by given container ID in a
+                # list; without watermarks, only the latest one.
+                if watermarks is not None:
+                    values = watermarks.select_new(metric['name'], osm_container_id,
+                                                   result['values'])
+                else:
+                    values = result['values'][-1:]
+                # A series without new values is still alive; keep its latest published value
+                if not values and suppressor is not None:
+                    suppressor.mark_seen(metric['name'], osm_container_id)
+                if values:
+                    samples = [(convert_unix_timestamp_to_datetime_str(value[0]), value[1])
+                               for value in values]
+                    proper_tm, latest_value = samples[-1]
+
+                    # Save temporary the inputs of the derived metrics (e.g. packet loss)
+                    if metric["name"] in derived_metrics.inputs:
+                        derived_metrics.add(osm_container_id, metric["name"], proper_tm,
+                                            latest_value)
+
+                    # Skip the series whose latest value has not changed since its latest message
+                    if suppressor is not None and \
+                            not suppressor.should_publish(metric['name'], osm_container_id,
+                                                          latest_value):
+                        continue
 
-                # Add an empty dict for an OSM container
-                if osm_container_id not in tx_rx_metrics.keys():
-                    tx_rx_metrics[osm_container_id] = {}
-
-                # Keep all the values for the requested metric by given container ID in a list.
-                values_len = len(result['values'])
-                if values_len:
-                    latest_value = result['values'][values_len - 1]
-                    metric_values.append(
-                        {"timestamp": convert_unix_timestamp_to_datetime_str(latest_value[0]),
-                         "unit": metric['unit'], "type": metric['type'], "name": metric['name'],
-                         "value": latest_value[1]})
-
-                    # Save temporary a set of useful metrics for the packet loss calculation
-                    if metric["name"] in ["container_network_receive_packets_dropped_total",
-                                          "container_network_receive_packets_total",
-                                          "container_network_transmit_packets_dropped_total",
-                                          "container_network_transmit_packets_total"]:
-                        tx_rx_metrics[osm_container_id][metric["name"]] = latest_value[1]
-                        proper_tm = convert_unix_timestamp_to_datetime_str(latest_value[0])
-                        tx_rx_metrics[osm_container_id]['timestamp'] = proper_tm
-
-                    # Push the metric values in batch per container ID
-                    payload = {"container_id": osm_container_id, "type": metric['type'],
-                               "data": metric_values}
+                    # Push the metric values in batch per container ID. The payload is
+                    # `{"container_id", "type", "data": [{"timestamp", "unit", "type", "name",
+                    # "value"}]}`, encoded once using the pre-encoded parts of the metric.
+                    if container_samples is not None:
+                        container_samples.setdefault(osm_container_id, []).extend(
+                            payload_encoder.encode_sample(metric['name'], timestamp, value)
+                            for timestamp, value in samples)
+                        continue
+                    payload = payload_encoder.encode(osm_container_id, metric['name'], samples)
                     logger.debug("Generic metrics: {}".format(payload))
-                    publish_metrics(producer, payload)
+                    producer.publish(payload, get_message_key(osm_container_id, metric['name']))
         except Exception as ex:
             error_logger.exception(ex)
+            continue
+        # Only a fully parsed response drops the series that are missing from it
+        for metric in metrics:
+            parsed_metrics.add(metric['name'])
+            if watermarks is not None:
+                watermarks.mark_fetched(metric['name'])
+            if suppressor is not None:
+                suppressor.mark_fetched(metric['name'])
 
-    # The tx_rx_metrics keeps the required metrics for the calculation of the
-    # packet loss in each container. Indicative sample:
-    # --------------------
-    # {
-    #   "bfbcd872d6b64adcbcd872d6b64adcf1": {
-    #     "timestamp": "2019-04-24T07:56:34.158000Z",
-    #     "container_network_receive_packets_dropped_total": "0",
-    #     "container_network_transmit_packets_dropped_total": "0",
-    #     "container_network_transmit_packets_total": "15.5",
-    #     "container_network_receive_packets_total": "36"
-    #   },
-    #   "c7a07d28d38746c6a07d28d38746c630": {
-    #     "timestamp": "2019-04-24T07:56:34.158000Z",
-    #     "container_network_receive_packets_dropped_total": "0",
-    #     "container_network_transmit_packets_dropped_total": "0",
-    #     "container_network_transmit_packets_total": "16.875",
-    #     "container_network_receive_packets_total": "37.25"
-    #   }
-    # }
-    for container in tx_rx_metrics.keys():
-        # Packet loss in RX
-        try:
-            container_network_receive_packet_loss_percentage = calculate_packet_loss_values(
-                tx_rx_metrics[container].get('container_network_receive_packets_dropped_total'),
-                tx_rx_metrics[container].get('container_network_receive_packets_total'))
-            rx_payload = {"container_id": container,
-                          "type": 'container_network_receive_packet_loss_percentage',
-                          "data": [{"timestamp": tx_rx_metrics[container]["timestamp"],
-                                    "unit": "%", "type": "counter",
-                                    "name": "container_network_receive_packet_loss_percentage",
-                                    "value": container_network_receive_packet_loss_percentage}]}
-            logger.debug("rx_packet_loss: {}".format(rx_payload))
-            publish_metrics(producer, rx_payload)
-        except TypeError as ex:
-            error_logger.error(ex)
-
-        # Packet loss in TX
-        try:
-            container_network_transmit_packet_loss_percentage = calculate_packet_loss_values(
-                tx_rx_metrics[container].get('container_network_transmit_packets_dropped_total'),
-                tx_rx_metrics[container].get('container_network_transmit_packets_total'))
-            tx_payload = {"container_id": container,
-                          "type": 'container_network_transmit_packet_loss_percentage',
-                          "data": [{"timestamp": tx_rx_metrics[container]["timestamp"],
-                                    "unit": "%", "type": "counter",
-                                    "name": "container_network_transmit_packet_loss_percentage",
-                                    "value": container_network_transmit_packet_loss_percentage}]}
-            logger.debug("tx_packet_loss: {}".format(tx_payload))
-            publish_metrics(producer, tx_payload)
-        except TypeError as ex:
-            error_logger.error(ex)
-
-    # Close producer
-    producer.close()
-
-
-def publish_metrics(producer, payload):
-    """ Publish the payload in kafka bus
+    # Compute the derived metrics (e.g. the packet loss in RX/TX) of all the containers
+    if suppressor is not None:
+        for definition in derived_metrics.definitions:
+            if definition['numerator'] in parsed_metrics and \
+                    definition['denominator'] in parsed_metrics:
+                suppressor.mark_fetched(definition['name'])
+    for container, definition, timestamp, value in derived_metrics.compute():
+        if suppressor is not None and \
+                not suppressor.should_publish(definition['name'], container, value):
+            continue
+        if container_samples is not None:
+            container_samples.setdefault(container, []).append(
+                payload_encoder.encode_sample(definition['name'], timestamp, value))
+            continue
+        payload = {"container_id": container, "type": definition['name'],
+                   "data": [{"timestamp": timestamp, "unit": definition['unit'],
+                             "type": definition['type'], "name": definition['name'],
+                             "value": value}]}
+        logger.debug("Derived metrics: {}".format(payload))
+        producer.publish(payload, get_message_key(container, definition['name']))
+
+    # Publish a single message per container (see `CONTAINER_PAYLOAD_SCHEMA_VERSION`)
+    if container_samples is not None:
+        for container, encoded_samples in container_samples.items():
+            payload = payload_encoder.encode_container(container, encoded_samples,
+                                                       CONTAINER_PAYLOAD_SCHEMA_VERSION)
+            logger.debug("Container metrics: {}".format(payload))
+            producer.publish(payload, get_message_key(container))
+
+    # Replay a limited number of the messages that were spooled during a kafka outage
+    producer.replay(KAFKA_SPOOL_REPLAY_MAX_MESSAGES)
+
+    # Wait for the in-flight messages once, at the end of the cycle
+    counters = producer.flush(timeout=KAFKA_FLUSH_TIMEOUT)
+    logger.info("Kafka messages: {} acked, {} failed, {} spooled, {} replayed".format(
+        counters["acked"], counters["failed"], counters["spooled"], counters["replayed"]))
+    if producer.spool is not None:
+        SPOOL_BYTES.set(producer.spool.size())
+    if suppressor is not None:
+        logger.info("Suppressed {} unchanged values".format(suppressor.suppressed))
+        MESSAGES.labels("suppressed").inc(suppressor.suppressed)
+
+    # Advance the watermarks only if every message was delivered or spooled; otherwise the
+    # next cycle re-fetches the values after the previous watermarks
+    if watermarks is not None:
+        if counters["failed"] > counters["spooled"]:
+            watermarks.rollback()
+        else:
+            watermarks.commit()
+    # Likewise, the values that were not delivered are re-published in the next cycle
+    if suppressor is not None:
+        if counters["failed"] > counters["spooled"]:
+            suppressor.rollback()
+        else:
+            suppressor.commit()
+
+
+def fetch_metrics_batch(prom_ql, metrics, pod_labels=None, window=None, keep_last=True):
+    """ Fetch the values of the given metrics for any running container having the label 'vim_id'
+
+    A single metric is fetched through its own query; more metrics are fetched through one
+    batched query and its series are demultiplexed per metric by their `metric_name` label.
+    If the responses are streamed, only the start of the body is read here; the series are
+    parsed one by one while they are iterated, so the response is never materialized.
 
     Args:
-        producer (iterator): The kafka iterator
-        payload (dict): The message to be published
+        prom_ql (object): The Query or the QueryRange object
+        metrics (list): The metrics as defined in the `PROMETHEUS_METRICS_LIST`
+        pod_labels (object, optional): The PodLabelsIndex object that enriches the results
+            locally. If it is None, the pod labels are joined in Prometheus.
+        window (tuple, optional): The start and the end unix timestamps of the queries
+        keep_last (bool): True to keep only the latest value of each series while the
+            (streamed) response is parsed
 
     Returns:
-        None
+        iterator: the metric (dict) and the result (dict) of each series or None if the
+            request failed
+    """
+    join = pod_labels is None
+    started_at = time.time()
+    if len(metrics) == 1:
+        response = retrieve_values(prom_ql, metrics[0]['name'], join=join, window=window)
+    else:
+        response = retrieve_batch_values(prom_ql, [metric['name'] for metric in metrics],
+                                         join=join, window=window)
+    # The latency of the query only; a streamed body is read while its series are published
+    duration = time.time() - started_at
+    for metric in metrics:
+        QUERY_DURATION.labels(metric['name']).observe(duration)
+    if response.status_code != 200:
+        error_logger.error("GET {} - {}".format(response.url, response.text))
+        for metric in metrics:
+            QUERY_FAILURES.labels(metric['name']).inc()
+        return None
+
+    if PROMETHEUS_STREAM_RESPONSES:
+        # Parse the series one by one, keeping only the latest value of each one if requested
+        result_type, results = stream_results(response, keep_last=keep_last)
+    else:
+        response_body = response.json()
+        result_type = response_body['data'].get('resultType')
+        results = response_body['data'].get('result', [])
+    if result_type == "vector":
+        # The instant queries return only the latest value per container
+        results = convert_vector_to_matrix(results)
+    elif result_type != "matrix":
+        logger.warning("The `resultType` is not the matrix. It is `{}`".format(result_type))
+    if pod_labels is not None:
+        results = pod_labels.enrich(results)
+    return iter_metric_series(metrics, results, response)
+
+
+def iter_metric_series(metrics, results, response):
+    """ Pair each series of a response with its metric and observe the size and the series
+    of the response once it is consumed
+
+    Args:
+        metrics (list): The metrics of the query
+        results (iterable): The `result` list of the response
+        response (object): The requests object of the query
+
+    Yields:
+        tuple: the metric (dict) and the result (dict) of each series
     """
-    request = producer.send(KAFKA_KUBERNETES_TOPIC, payload)
+    metrics_by_name = {metric['name']: metric for metric in metrics}
+    series = Counter()
     try:
-        request.get(timeout=3)
-    except KafkaError as ex:
-        error_logger.error(ex)
+        for result in results:
+            if len(metrics) == 1:
+                metric = metrics[0]
+            else:
+                metric = metrics_by_name.get(result.get('metric', {}).get('metric_name'))
+                if metric is None:
+                    continue
+            series[metric['name']] += 1
+            yield metric, result
+    except Exception:
+        # e.g. a timeout or a truncated body while a streamed response is parsed
+        for metric in metrics:
+            QUERY_FAILURES.labels(metric['name']).inc()
+        raise
+
+    response_size = response.raw.tell() if PROMETHEUS_STREAM_RESPONSES else \
+        len(response.content)
+    for metric in metrics:
+        QUERY_RESPONSE_SIZE.labels(metric['name']).observe(response_size)
+        SERIES_PARSED.labels(metric['name']).inc(series[metric['name']])
+
+
+def fetch_metrics(prom_ql, metrics, pod_labels=None, window=None, watermarks=None):
+    """ Fetch the values of the given metrics keeping up to `PROMETHEUS_MAX_CONCURRENT_QUERIES`
+    requests in-flight, so the duration of a cycle tracks the slowest query. Each request
+    covers up to `PROMETHEUS_QUERY_BATCH_SIZE` metrics.
+
+    Args:
+        prom_ql (object): The Query or the QueryRange object
+        metrics (list): The metrics as defined in the `PROMETHEUS_METRICS_LIST`
+        pod_labels (object, optional): The PodLabelsIndex object
+        window (tuple, optional): The start and the end unix timestamps of the queries
+        watermarks (object, optional): The WatermarkStore object; each query starts from the
+            oldest watermark of its metrics
+
+    Yields:
+        tuple: the metrics (list) of a request and the iterator of its series (see
+            `fetch_metrics_batch`), in completion order
+    """
+    batch_size = max(1, PROMETHEUS_QUERY_BATCH_SIZE)
+    batches = [metrics[i:i + batch_size] for i in range(0, len(metrics), batch_size)]
+    max_workers = max(1, PROMETHEUS_MAX_CONCURRENT_QUERIES)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for batch in batches:
+            batch_window = window
+            if watermarks is not None:
+                batch_window = (watermarks.get_query_start([m['name'] for m in batch], window),
+                                window[1])
+            futures[executor.submit(fetch_metrics_batch, prom_ql, batch, pod_labels,
+                                    batch_window, watermarks is None)] = batch
+        for future in as_completed(futures):
+            try:
+                series = future.result()
+            except Exception as ex:
+                # e.g. a connection error or a timeout of the request
+                error_logger.exception(ex)
+                for metric in futures[future]:
+                    QUERY_FAILURES.labels(metric['name']).inc()
+                continue
+            if series is not None:
+                yield futures[future], series
 
 
 if __name__ == '__main__':
-    # Retrieve the data every X seconds
-    schedule.every(int(SCHEDULER_SECONDS)).seconds.do(main)
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+    # The kafka producer and the Prometheus client are re-used across the cycles
+    kafka_spool = Spool(KAFKA_SPOOL_DIR, KAFKA_SPOOL_SEGMENT_BYTES, KAFKA_SPOOL_MAX_BYTES) \
+        if KAFKA_SPOOL_DIR else None
+    kafka_producer = Producer(spool=kafka_spool)
+    # Only the latest value of each container is published, so an instant query is enough
+    if PROMETHEUS_QUERY_MODE == "instant":
+        prometheus_query = query.Query(token=None, stream=PROMETHEUS_STREAM_RESPONSES)
+    else:
+        prometheus_query = query_range.QueryRange(token=None, stream=PROMETHEUS_STREAM_RESPONSES)
+    pod_labels_index = PodLabelsIndex(PROMETHEUS_POD_LABELS_TTL) \
+        if PROMETHEUS_POD_LABELS_TTL > 0 else None
+    # The state is kept per shard, so the replicas of a shard share it
+    state_backend = get_state_backend(STATE_BACKEND, STATE_REDIS_URL,
+                                      "{}:shard-{}".format(STATE_KEY_PREFIX, SHARD_INDEX)) \
+        if STATE_BACKEND != "memory" or STATE_LEADER_LOCK else None
+    watermark_store = WatermarkStore(WATERMARKS_FILE or None, WATERMARKS_MAX_BACKFILL_SECONDS,
+                                     backend=state_backend) if WATERMARKS_ENABLED else None
+    delta_suppressor = DeltaSuppressor(SUPPRESSION_THRESHOLD, SUPPRESSION_HEARTBEAT_CYCLES,
+                                       backend=state_backend) if SUPPRESSION_ENABLED else None
+
+    if INGESTION_MODE == "remote_write":
+        # Publish the samples pushed by Prometheus instead of querying them; the metrics that
+        # are evaluated by a PromQL expression are not available in this mode
+        ingester = RemoteWriteIngester(
+            kafka_producer, [metric for metric in SHARD_METRICS_LIST if not metric['derived']],
+            payload_encoder, DERIVED_METRICS_LIST, pod_labels_index, KAFKA_PAYLOAD_MODE,
+            REMOTE_WRITE_STALENESS_SECONDS, CONTAINER_PAYLOAD_SCHEMA_VERSION)
+        run = partial(run_forever, RemoteWriteServer(REMOTE_WRITE_PORT, ingester),
+                      kafka_producer, int(SCHEDULER_SECONDS), KAFKA_FLUSH_TIMEOUT,
+                      KAFKA_SPOOL_REPLAY_MAX_MESSAGES, prometheus_query)
+    else:
+        # Retrieve the data every X seconds, aligned to the wall-clock
+        scheduler = AlignedScheduler(
+            int(SCHEDULER_SECONDS),
+            partial(main, kafka_producer, prometheus_query, pod_labels_index,
+                    watermarks=watermark_store, suppressor=delta_suppressor,
+                    state=state_backend if STATE_LEADER_LOCK else None))
+        run = scheduler.run_forever
+    try:
+        run()
+    finally:
+        kafka_producer.close()